@@ -0,0 +1,53 @@
+"""Chunk sizes, predicted and measured peak memory per chunk, and users/s of budgeted evaluation
+(`validation.evaluate`) and bulk scoring (`recommender.recommend_all`) on a synthetic catalogue.
+
+The fixed rows use the batch size train.py used before budgets (`--fixed`), whatever the catalogue size.
+Run from the repository root: python -m benchmarks.chunking --items 60000 --budgets 64 256 1024
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from torch.utils.data import DataLoader
+
+from chunking import EVALUATION, SCORING, ChunkMemory, bytes_per_user, chunk_size
+from dataset2 import SharedCSRDataset
+from model_cfwgan import CFWGAN
+from recommender import recommend_all
+from validation import evaluate
+
+
+def interactions(users, items, density, seed):
+    matrix = sp.random(users, items, density=density, format='csr', random_state=np.random.RandomState(seed))
+    matrix.data[:] = 1
+    return SharedCSRDataset.from_matrix(matrix)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2048)
+    parser.add_argument('--items', type=int, default=60000)
+    parser.add_argument('--density', type=float, default=0.002)
+    parser.add_argument('--budgets', type=float, nargs='+', default=[64, 256, 1024])
+    parser.add_argument('--fixed', type=int, default=64)
+    args = parser.parse_args()
+
+    train = interactions(args.users, args.items, args.density, 0)
+    val = interactions(args.users, args.items, args.density / 4, 1)
+    model = CFWGAN(train, args.items).eval()
+    print(f'{"task":>10} {"budget MB":>10} {"chunk":>6} {"predicted MB":>13} {"peak MB":>8} {"users/s":>8}')
+    for name, profile in (('evaluate', EVALUATION), ('recommend', SCORING)):
+        for budget in [None] + args.budgets:
+            size = args.fixed if budget is None else chunk_size(args.items, budget, profile)
+            memory = ChunkMemory()
+            start = time.perf_counter()
+            if name == 'evaluate':
+                evaluate(model, DataLoader(val, size), memory=memory)
+            else:
+                budget_mb = size * bytes_per_user(args.items, profile) / 2 ** 20
+                recommend_all(model.generator, train, budget_mb=budget_mb, memory=memory)
+            rate = args.users / (time.perf_counter() - start)
+            predicted = size * bytes_per_user(args.items, profile) / 2 ** 20
+            print(f'{name:>10} {"fixed" if budget is None else budget:>10} {size:>6} {predicted:>13.1f} '
+                  f'{memory.summary()["peak_mb"]:>8.1f} {rate:>8.1f}')
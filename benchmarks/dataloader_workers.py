@@ -0,0 +1,71 @@
+"""Epoch time and worker memory of the training DataLoader as `num_workers` grows.
+
+Compares the full `MovieLensDataset` (forked/pickled into every worker) with its `share_memory()` view.
+Run from the repository root: python -m benchmarks.dataloader_workers --workers 0 1 2 4
+"""
+import argparse
+import os
+import time
+
+from torch.utils.data import DataLoader
+
+from dataset2 import MovieLensDataset
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def workers_memory():
+    """Unique (USS) memory of the current process' children in MB, RSS when psutil is not installed."""
+    if psutil is not None:
+        children = psutil.Process().children(recursive=True)
+        return sum(c.memory_full_info().uss for c in children) / 2 ** 20
+    total = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat', 'r') as file:
+                ppid = int(file.read().rsplit(')', 1)[1].split()[1])
+            if ppid == os.getpid():
+                with open(f'/proc/{pid}/statm', 'r') as file:
+                    total += int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / 2 ** 20
+
+
+def run(dataset, num_workers, batch_size, epochs):
+    loader = DataLoader(dataset, batch_size, shuffle=True, num_workers=num_workers,
+                        persistent_workers=num_workers > 0)
+    it = iter(loader)
+    next(it)  # workers are started
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for _ in loader:
+            pass
+    elapsed = (time.perf_counter() - start) / epochs
+    memory = workers_memory()
+    del it, loader
+    return elapsed, memory
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=3)
+    args = parser.parse_args()
+
+    dataset = MovieLensDataset(args.ratings)
+    datasets = {'dataset': dataset, 'shared': dataset.share_memory()}
+    print(f'{"mode":>8} {"workers":>7} {"epoch (s)":>10} {"speedup":>8} {"workers MB":>11}')
+    for name, d in datasets.items():
+        baseline = None
+        for w in args.workers:
+            elapsed, memory = run(d, w, args.batch_size, args.epochs)
+            baseline = baseline or elapsed
+            print(f'{name:>8} {w:>7} {elapsed:>10.3f} {baseline / elapsed:>8.2f} {memory:>11.1f}')
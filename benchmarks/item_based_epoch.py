@@ -0,0 +1,43 @@
+"""Split and epoch time of `MovieLensDataset` in user-based and item-based mode.
+
+`transposed` reproduces the former item-based layout (a CSC matrix from `matrix.transpose()`) for comparison.
+Run from the repository root: python -m benchmarks.item_based_epoch
+"""
+import argparse
+import time
+
+from torch.utils.data import DataLoader
+
+from dataset2 import MovieLensDataset
+
+
+def epoch_time(dataset, batch_size, epochs):
+    loader = DataLoader(dataset, batch_size, shuffle=True)
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for _ in loader:
+            pass
+    return (time.perf_counter() - start) / epochs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=3)
+    args = parser.parse_args()
+
+    transposed = MovieLensDataset(args.ratings)
+    transposed.matrix = transposed.matrix.transpose()
+    datasets = {
+        'user': MovieLensDataset(args.ratings, item_based=False),
+        'item': MovieLensDataset(args.ratings, item_based=True),
+        'transposed': transposed,
+    }
+    print(f'{"mode":>10} {"rows":>7} {"format":>6} {"split (s)":>10} {"epoch (s)":>10}')
+    for name, dataset in datasets.items():
+        start = time.perf_counter()
+        train, _ = dataset.split_train_test(test_size=0.2)
+        split = time.perf_counter() - start
+        print(f'{name:>10} {len(dataset):>7} {dataset.matrix.format:>6} {split:>10.3f} '
+              f'{epoch_time(dataset, args.batch_size, args.epochs):>10.3f}')
@@ -0,0 +1,119 @@
+"""Dense versus sampled-output CFWGAN training (`CFWGAN(sampled_output=True)`).
+
+Metric parity: both modes train for `--steps` steps from the same initialization, with the same fixed-count ZR
+negatives, on the train.py splits of `--ratings`, and report NDCG@5 / P@5 on the validation split. The sampled
+mode is forced even where the batch columns cover most of the catalogue.
+Throughput: per-step time and peak memory of both modes on a synthetic catalogue of `--synthetic-items` items.
+Run from the repository root: python -m benchmarks.sampled_output --steps 3000 --synthetic-items 60000
+"""
+import argparse
+import copy
+import os
+import tempfile
+import time
+
+import pytorch_lightning as pl
+import torch
+from torch.utils.data import DataLoader
+
+import synthetic
+from profiling import PeakMemory
+from dataset2 import MovieLensDataset
+from model_cfwgan import CFWGAN
+from negative_sampler import NegativeSampler
+from validation import evaluate
+
+
+def train(model, loader, steps, max_fraction=1.):
+    """`steps` steps of the d_steps/g_steps schedule of `CFWGAN.training_step`, without a Trainer. The sampled
+    mode always restricts the columns here, even where `training_step` would fall back to dense."""
+    (opt_g, opt_d), _ = model.configure_optimizers()
+    batches = iter(loader)
+    for step in range(steps):
+        try:
+            items, _ = next(batches)
+        except StopIteration:
+            batches = iter(loader)
+            items, _ = next(batches)
+        zr, _ = model.negative_sampling(items)
+        columns = model.sampled_columns(items, zr, max_fraction) if model.sampled_output else None
+        if step % (model.g_steps + model.d_steps) >= model.g_steps:
+            loss, _ = model.discriminator_loss(items, columns)
+            optimizer = opt_d
+        else:
+            loss, _ = model.generator_loss(items, zr, columns)
+            optimizer = opt_g
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    return model
+
+
+def parity(args):
+    pl.seed_everything(12323)
+    dataset = MovieLensDataset(args.ratings)
+    train_split, test = dataset.split_train_test(test_size=0.4)
+    test, val = test.split_train_test(test_size=0.5)
+    rows = train_split.share_memory()
+    sampler = NegativeSampler(rows)
+    dense = CFWGAN(rows, dataset.item_count, alpha=0.1, s_zr=args.negatives, s_pm=args.negatives, d_steps=5,
+                   negative_sampler=sampler)
+    sampled = copy.deepcopy(dense)
+    sampled.sampled_output = True
+    val_loader = DataLoader(val.share_memory(), 64)
+    print(f'{"mode":>8} {"s/step":>8} ' + ' '.join(f'{m:>14}' for m in ('ndcg_at_5', 'precision_at_5')))
+    for name, model in (('dense', dense), ('sampled', sampled)):
+        torch.manual_seed(0)
+        start = time.perf_counter()
+        train(model, DataLoader(rows, args.batch_size, shuffle=True), args.steps)
+        elapsed = (time.perf_counter() - start) / args.steps
+        metrics = evaluate(model, val_loader)
+        print(f'{name:>8} {elapsed:>8.4f} {metrics["ndcg_at_5"]:>14.4f} {metrics["precision_at_5"]:>14.4f}')
+
+
+def throughput(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic.write_movielens(tmp, synthetic.ratings(args.synthetic_users, args.synthetic_items),
+                                  synthetic.movies(args.synthetic_items))
+        dataset = MovieLensDataset(os.path.join(tmp, 'ratings.csv'))
+    rows = dataset.share_memory()
+    print(f'{dataset.item_count} items')
+    print(f'{"mode":>8} {"batch":>6} {"columns":>8} {"d ms":>8} {"g ms":>8} {"peak MB":>8}')
+    for batch_size in args.batch_sizes:
+        for sampled_output in (False, True):
+            torch.manual_seed(0)
+            model = CFWGAN(rows, dataset.item_count, alpha=0.1, s_zr=args.negatives, s_pm=args.negatives,
+                           negative_sampler=NegativeSampler(rows), sampled_output=sampled_output)
+            items = rows[torch.arange(batch_size)][0]
+            zr, _ = model.negative_sampling(items)
+            columns = model.sampled_columns(items, zr, max_fraction=1.) if sampled_output else None
+            times = []
+            with PeakMemory() as memory:
+                for loss in (lambda: model.discriminator_loss(items, columns)[0],
+                             lambda: model.generator_loss(items, zr, columns)[0]):
+                    loss().backward()
+                    start = time.perf_counter()
+                    for _ in range(args.repeats):
+                        loss().backward()
+                    times.append((time.perf_counter() - start) / args.repeats * 1000)
+            width = dataset.item_count if columns is None else len(columns)
+            print(f'{"sampled" if sampled_output else "dense":>8} {batch_size:>6} {width:>8} {times[0]:>8.1f} '
+                  f'{times[1]:>8.1f} {memory.delta:>8.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--steps', type=int, default=3000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--negatives', type=int, default=128, help='fixed ZR/PM count per user')
+    parser.add_argument('--synthetic-users', type=int, default=20000)
+    parser.add_argument('--synthetic-items', type=int, default=60000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32, 128])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--skip-parity', action='store_true')
+    args = parser.parse_args()
+
+    if not args.skip_parity:
+        parity(args)
+    throughput(args)
@@ -0,0 +1,68 @@
+"""Load test of the micro-batching server (`serving.py`) with local TCP clients.
+
+Starts the server in-process on a randomly initialised generator, lets `--clients` concurrent connections send
+`--requests` single-user requests each, and reports throughput, latency percentiles and the mean batch size for
+every (max batch size, max latency) setting. A max batch size of 1 is the unbatched baseline.
+Run from the repository root: python -m benchmarks.serving_load --batch-sizes 1 16 64 --latencies-ms 2 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from dataset2 import MovieLensDataset
+from model_cfwgan import Generator
+from serving import BatchingRecommender, serve
+
+
+async def client(host, port, users, requests, k, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    for _ in range(requests):
+        start = time.perf_counter()
+        writer.write((json.dumps({'user': random.randrange(users), 'k': k}) + '\n').encode())
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        assert 'items' in response, response
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def run(generator, histories, args, max_batch_size, max_latency_ms):
+    recommender = BatchingRecommender(generator, histories, max_batch_size=max_batch_size,
+                                      max_latency_ms=max_latency_ms)
+    server = await serve(recommender, '127.0.0.1', args.port)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client('127.0.0.1', args.port, len(histories), args.requests, args.k, latencies)
+                           for _ in range(args.clients)])
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    await recommender.stop()
+    latencies.sort()
+    percentile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f'{max_batch_size:>6} {max_latency_ms:>8.1f} {len(latencies) / elapsed:>10.1f} '
+          f'{statistics.median(latencies) * 1000:>8.2f} {percentile(0.95):>8.2f} {percentile(0.99):>8.2f} '
+          f'{recommender.requests / recommender.batches:>6.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--config', default='movielens-100k')
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--latencies-ms', type=float, nargs='+', default=[2., 5.])
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    histories = MovieLensDataset(args.ratings).share_memory()
+    generator = Generator(histories.item_count, args.config)
+    print(f'{"batch":>6} {"wait ms":>8} {"req/s":>10} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"mean":>6}')
+    for max_batch_size in args.batch_sizes:
+        for max_latency_ms in (args.latencies_ms if max_batch_size > 1 else [0.]):
+            asyncio.run(run(generator, histories, args, max_batch_size, max_latency_ms))
@@ -0,0 +1,55 @@
+"""Throughput and memory of `serving_pool.ServingPool` from 1 to N worker processes.
+
+A randomly initialised generator is exported once and served by every pool size; `--clients` connections send
+`--requests` single-user requests each (see `benchmarks.serving_load`). RSS counts the mapped weight pages in
+every worker, PSS splits them among the workers sharing them.
+Run from the repository root: python -m benchmarks.serving_pool --workers 1 2 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.serving_load import client
+from dataset2 import MovieLensDataset, SharedCSRDataset
+from model_cfwgan import Generator
+from serving_pool import ServingPool, export_generator
+
+
+async def load(args, users):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client('127.0.0.1', args.port, users, args.requests, args.k, latencies)
+                           for _ in range(args.clients)])
+    return len(latencies) / (time.perf_counter() - start), statistics.median(latencies) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--config', default='movielens-100k')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=None, help='intra-op threads per worker')
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-latency-ms', type=float, default=5.)
+    parser.add_argument('--port', type=int, default=8767)
+    args = parser.parse_args()
+
+    dataset = MovieLensDataset(args.ratings)
+    with tempfile.TemporaryDirectory() as tmp:
+        weights, histories = os.path.join(tmp, 'generator.pt'), os.path.join(tmp, 'histories')
+        export_generator(Generator(dataset.item_count, args.config).state_dict(), weights, args.config)
+        SharedCSRDataset.save_matrix(dataset.matrix, histories)
+        print(f'weights: {os.path.getsize(weights) / 2 ** 20:.1f} MB')
+        print(f'{"workers":>8} {"threads":>8} {"req/s":>10} {"p50 ms":>8} {"RSS MB":>8} {"PSS MB":>8}')
+        for workers in args.workers:
+            with ServingPool(weights, histories, workers, args.threads, port=args.port,
+                             max_batch_size=args.max_batch_size, max_latency_ms=args.max_latency_ms) as pool:
+                throughput, median = asyncio.run(load(args, len(dataset)))
+                rss, pss = (sum(m) for m in zip(*pool.memory()))
+                print(f'{workers:>8} {pool.threads:>8} {throughput:>10.1f} {median:>8.2f} {rss:>8.1f} {pss:>8.1f}')
@@ -0,0 +1,147 @@
+"""Timing and memory benchmarks of ingestion, sampling, training steps, metrics and recommendation.
+
+Every benchmark runs at each requested scale and appends one JSON object per line to `--output`, tagged with the
+commit and torch version so runs can be compared over time.
+Run from the repository root: python -m benchmarks.suite --scales ml-100k ml-latest-small synthetic
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from dataset2 import MovieLensDataset
+from genre_index import GenreIndex
+from model_cfwgan import CFWGAN
+from negative_sampler import NegativeSampler
+from profiling import PeakMemory
+from recommender import recommend, rerank
+import synthetic
+
+SCALES = {
+    'ml-100k': 'movielens/ml-100k/ratings.csv',
+    'ml-latest-small': 'movielens/ml-latest-small/ratings.csv',
+    'synthetic': None,
+}
+
+
+def measure(fn, repeats, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    with PeakMemory() as memory:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'repeats': repeats,
+            'peak_mb': memory.delta}
+
+
+def rerank_full(generator, vectors, candidates):
+    """`rerank` baseline: scores the whole catalogue, then picks the candidates."""
+    with torch.no_grad():
+        return [s[c] for s, c in zip(generator(vectors), candidates)]
+
+
+def benchmarks(path, cache, batch_size):
+    """Yields (name, callable, dataset info) for one dataset scale."""
+    dataset = MovieLensDataset(path)
+    dataset.save(cache)
+    rows = dataset.share_memory()
+    model = CFWGAN(rows, dataset.item_count, alpha=0.1, s_zr=0.5, s_pm=0.5)
+    opt_g = torch.optim.Adam(model.generator.parameters(), lr=0.0001, betas=(0., 0.9))
+    opt_d = torch.optim.Adam(model.discriminator.parameters(), lr=0.0001, betas=(0., 0.9))
+    batch = rows[np.arange(min(batch_size, len(rows)))][0]
+    zr, _ = model.negative_sampling(batch)
+    uniform, popular = NegativeSampler(rows), NegativeSampler(rows, power=0.75)
+    scores = torch.rand(256, dataset.item_count)
+    targets = rows[np.arange(min(256, len(rows)))][0]
+    genres = GenreIndex.from_movies(pd.read_csv(os.path.join(os.path.dirname(path), 'movies.csv')),
+                                    dataset.movie_le.classes_)
+    candidates = [np.random.RandomState(u).choice(dataset.item_count, 200, replace=False).tolist()
+                  for u in range(len(targets))]
+    filters = [{'any': genres.genres[i % len(genres.genres):][:2]} for i in range(len(targets))]
+
+    def g_step():
+        g_loss, _ = model.generator_loss(batch, zr)
+        opt_g.zero_grad()
+        g_loss.backward()
+        opt_g.step()
+
+    def d_step(sparse_condition=False):
+        model.sparse_condition = sparse_condition
+        d_loss, _ = model.discriminator_loss(batch)
+        opt_d.zero_grad()
+        d_loss.backward()
+        opt_d.step()
+
+    def metrics():
+        CFWGAN.precision_at_n(scores, targets, n=5)
+        CFWGAN.recall_at_n(scores, targets, n=5)
+        CFWGAN.ndcg(scores, targets, n=5)
+
+    info = {'users': len(dataset), 'items': dataset.item_count, 'interactions': int(dataset.matrix.nnz)}
+    yield 'dataset_csv', lambda: MovieLensDataset(path), info
+    yield 'dataset_cache', lambda: MovieLensDataset.load(cache), info
+    yield 'split_train_test', lambda: dataset.split_train_test(test_size=0.2), info
+    yield 'negative_sampling', lambda: model.negative_sampling(batch), info
+    yield 'negative_sampling_alias', lambda: (uniform(batch, 0.5), uniform(batch, 0.5)), info
+    yield 'negative_sampling_alias_128', lambda: (popular(batch, 128), popular(batch, 128)), info
+    yield 'g_step', g_step, info
+    yield 'd_step', d_step, info
+    yield 'd_step_sparse_condition', lambda: d_step(sparse_condition=True), info
+    yield 'metrics', metrics, info
+    yield 'recommend_single', lambda: recommend(model.generator, batch[:1]), info
+    yield 'recommend_batch', lambda: recommend(model.generator, targets), info
+    yield 'rerank_full_single', lambda: rerank_full(model.generator, targets[:1], candidates[:1]), info
+    yield 'rerank_candidates_single', lambda: rerank(model.generator, targets[:1], candidates[:1]), info
+    yield 'rerank_full', lambda: rerank_full(model.generator, targets, candidates), info
+    yield 'rerank_candidates', lambda: rerank(model.generator, targets, candidates), info
+    yield 'recommend_batch_genre', lambda: recommend(model.generator, targets, allowed=genres.mask(filters)), info
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', nargs='+', default=list(SCALES), choices=list(SCALES))
+    parser.add_argument('--only', nargs='+', default=None, help='names of the benchmarks to run')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--synthetic-users', type=int, default=20000)
+    parser.add_argument('--synthetic-items', type=int, default=10000)
+    parser.add_argument('--synthetic-activity', type=float, default=50)
+    parser.add_argument('--output', default='benchmarks/results.jsonl')
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    context = {'commit': commit(), 'torch': torch.__version__, 'machine': platform.machine(),
+               'threads': torch.get_num_threads(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with tempfile.TemporaryDirectory() as tmp, open(args.output, 'a') as output:
+        for scale in args.scales:
+            path = SCALES[scale]
+            if path is None:
+                synthetic.write_movielens(tmp, synthetic.ratings(args.synthetic_users, args.synthetic_items,
+                                                                 args.synthetic_activity),
+                                          synthetic.movies(args.synthetic_items))
+                path = os.path.join(tmp, 'ratings.csv')
+            for name, fn, info in benchmarks(path, os.path.join(tmp, scale), args.batch_size):
+                if args.only is not None and name not in args.only:
+                    continue
+                result = {'benchmark': name, 'scale': scale, **info, **measure(fn, args.repeats), **context}
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+                print(f'{scale:>16} {name:>24} {result["median_s"] * 1000:>10.2f} ms {result["peak_mb"]:>8.1f} MB')
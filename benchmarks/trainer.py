@@ -0,0 +1,75 @@
+"""Training steps per second of the Lightning path (`pl.Trainer` with the train.py loader) against the plain
+`trainer.Trainer`, eager and compiled, on the same train split of `--ratings` and the same models.
+
+The first `--warmup` steps (compilation, loader start-up) are not timed.
+Run from the repository root: python -m benchmarks.trainer --steps 500
+"""
+import argparse
+import time
+
+import pytorch_lightning as pl
+import torch
+from torch.utils.data import DataLoader
+
+from classifier_model import Model
+from dataset2 import MovieLensDataset
+from model_cfwgan import CFWGAN
+from negative_sampler import NegativeSampler
+from trainer import Trainer
+
+
+class StepTimer(pl.Callback):
+    def __init__(self, warmup):
+        self.warmup = warmup
+        self.start = None
+        self.steps = 0
+
+    def on_train_batch_end(self, trainer, pl_module, outputs, batch, batch_idx):
+        self.steps += 1
+        if self.steps == self.warmup:
+            self.start = time.perf_counter()
+
+    def rate(self):
+        return (self.steps - self.warmup) / (time.perf_counter() - self.start)
+
+
+def lightning(model, rows, args):
+    timer = StepTimer(args.warmup)
+    trainer = pl.Trainer(max_steps=args.warmup + args.steps, callbacks=[timer], logger=False,
+                         enable_checkpointing=False, enable_progress_bar=False, enable_model_summary=False)
+    trainer.fit(model, DataLoader(rows, args.batch_size, shuffle=True))
+    return timer.rate()
+
+
+def plain(model, rows, args, compile=False):
+    trainer = Trainer(args.warmup, args.batch_size, compile, hooks=())
+    trainer.fit(model, rows)
+    trainer.max_steps += args.steps
+    start = time.perf_counter()
+    trainer.fit(model, rows)
+    return args.steps / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--steps', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--negatives', type=int, default=128, help='fixed ZR/PM count per user')
+    args = parser.parse_args()
+
+    dataset = MovieLensDataset(args.ratings)
+    train_split, _ = dataset.split_train_test(test_size=0.2)
+    rows = train_split.share_memory()
+    sampler = NegativeSampler(rows)
+    models = {'cfwgan': lambda: CFWGAN(rows, dataset.item_count, alpha=0.1, s_zr=args.negatives,
+                                       s_pm=args.negatives, negative_sampler=sampler),
+              'classifier': lambda: Model(rows, None, None, dataset.item_count)}
+    print(f'{"model":>12} {"lightning":>10} {"plain":>10} {"compiled":>10}  steps/s')
+    for name, build in models.items():
+        rates = []
+        for run in (lightning, plain, lambda model, rows, args: plain(model, rows, args, compile=True)):
+            torch.manual_seed(0)
+            rates.append(run(build(), rows, args))
+        print(f'{name:>12} ' + ' '.join(f'{rate:>10.1f}' for rate in rates))
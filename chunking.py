@@ -0,0 +1,69 @@
+"""User chunk sizes from a memory budget, for evaluation and bulk scoring.
+
+Evaluation and recommendation densify each chunk of users into several (users, num_items) tensors, so the chunk
+size that fits in memory falls as the catalogue grows. A profile counts the dense tensors alive at the peak of a
+chunk by element type; `chunk_size` divides the budget by what one user costs under it:
+
+    loader = DataLoader(val_rows, chunk_size(val_rows.shape[1], budget_mb=1024))
+    metrics = evaluate(model, loader, memory=ChunkMemory())
+
+The budget covers these tensors only, not the model weights. `ChunkMemory` records the measured peak of every
+chunk, to check the profile against the actual run.
+"""
+import contextlib
+
+import torch
+
+from profiling import PeakMemory
+
+# `evaluate` and the ranking metrics: target, input, scores, the two copies of the users with targets and the
+# values of the sort, plus the argsort indices of the scores (kept by the top-n view) and of the targets
+EVALUATION = {'float': 6, 'int64': 2, 'bool': 1}
+# `recommender.recommend`: input, generator output, masked scores and the seen-item mask
+SCORING = {'float': 3, 'int64': 0, 'bool': 1}
+
+
+def bytes_per_user(num_items, profile=EVALUATION, dtype=torch.float32):
+    """Bytes of the dense tensors of one user under `profile`, the float ones being of `dtype`."""
+    float_size = torch.empty((), dtype=dtype).element_size()
+    return num_items * (profile['float'] * float_size + profile['int64'] * 8 + profile['bool'])
+
+
+def chunk_size(num_items, budget_mb, profile=EVALUATION, dtype=torch.float32, maximum=None):
+    """Largest number of users whose dense tensors fit in `budget_mb`, at least 1 and at most `maximum`."""
+    users = max(1, int(budget_mb * 2 ** 20 // bytes_per_user(num_items, profile, dtype)))
+    return users if maximum is None else min(users, maximum)
+
+
+def chunks(num_users, size):
+    """Consecutive (start, stop) user ranges of at most `size` users."""
+    for start in range(0, num_users, size):
+        yield start, min(start + size, num_users)
+
+
+class ChunkMemory:
+    """Peak memory in MB of each chunk run in `with memory.chunk():`, above the memory in use before it.
+
+    On CUDA the peak comes from the allocator statistics of `device`, on CPU from the sampled process RSS."""
+
+    def __init__(self, device='cpu'):
+        self.device = torch.device(device)
+        self.peaks = []
+
+    @contextlib.contextmanager
+    def chunk(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+            start = torch.cuda.memory_allocated(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+            yield
+            torch.cuda.synchronize(self.device)
+            self.peaks.append((torch.cuda.max_memory_allocated(self.device) - start) / 2 ** 20)
+        else:
+            with PeakMemory() as memory:
+                yield
+            self.peaks.append(memory.delta)
+
+    def summary(self):
+        return {'chunks': len(self.peaks), 'peak_mb': max(self.peaks, default=0.),
+                'mean_peak_mb': sum(self.peaks) / max(len(self.peaks), 1)}
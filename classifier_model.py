@@ -7,6 +7,8 @@ import pytorch_lightning as pl
 import torch
 from torch import nn
 
+from dataset2 import SharedCSRDataset
+
 class Classifier(nn.Module):
     def __init__(self, num_items, p=0.8, config='movielens-100k'):
         super().__init__()
@@ -23,13 +25,15 @@ class Classifier(nn.Module):
 
 
 class Model(pl.LightningModule):
-    def __init__(self, trainset, valset, testset, num_items):
+    def __init__(self, trainset, valset, testset, num_items, p=0.8, config='movielens-100k'):
         super().__init__()
-        self.classifier = Classifier(num_items)
+        self.classifier = Classifier(num_items, p, config)
         self.criterion = torch.nn.BCEWithLogitsLoss()
         self.trainset = trainset
         self.valset = valset
         self.testset = testset
+        self.val_seen = Model.seen_items(trainset, testset)
+        self.test_seen = Model.seen_items(trainset, valset)
         self.automatic_optimization = False
 
     def forward(self, item_full):
@@ -42,49 +46,52 @@ class Model(pl.LightningModule):
 
         items, idx = batch
 
-        output = self.classifier(items)
-        loss = self.criterion(output, items)
+        loss, output = self.loss(items)
         self.log('loss', loss, prog_bar=True, on_step=True, on_epoch=False)
         self.log('output_mean', output.mean(), prog_bar=False, on_step=True, on_epoch=False)
         opt.zero_grad()
-        self.manual_backward(loss, opt, retain_graph=True)
+        self.manual_backward(loss, retain_graph=True)
         opt.step()
 
-    def validation_step(self, batch, batch_idx):
+    def loss(self, items):
+        """Reconstruction loss of a batch of multi-hot histories, returned with the classifier output."""
+        output = self.classifier(items)
+        return self.criterion(output, items), output
+
+    @staticmethod
+    def seen_items(*datasets):
+        """Items already known for each user in any of `datasets`, merged once into a single CSR."""
+        if any(d is None for d in datasets):
+            return None
+        return SharedCSRDataset.from_matrix(sum(d.matrix for d in datasets))
+
+    @staticmethod
+    def exclude(output, seen, idx):
+        """Set the scores of the items of `seen` to -inf, touching only their positions."""
+        row, col = seen.nonzero(idx.cpu())
+        output[torch.from_numpy(row).to(output.device), torch.from_numpy(col).to(output.device)] = -float('inf')
+        return output
+
+    def evaluate(self, batch, ns=(5,), seen=None):
+        """Ranking metrics of one evaluation batch, the items of `seen` (default: train+test) being excluded."""
         items, idx = batch
-        train_items = self.trainset[idx.cpu()][0].to(items.device)
-        test_items = self.testset[idx.cpu()][0].to(items.device)
-        output = self.classifier(train_items)
-        output[torch.where(train_items == 1)] = -float('inf')
-        output[torch.where(test_items == 1)] = -float('inf')
-        precision_at_5 = Model.precision_at_n(output, items, n=5)
-        recall_at_5 = Model.recall_at_n(output, items, n=5)
-        ndcg_at_5 = Model.ndcg(output, items, n=5)
-        self.log('precision_at_5', precision_at_5, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('recall_at_5', recall_at_5, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('ndcg_at_5', ndcg_at_5, prog_bar=True, on_step=False, on_epoch=True)
+        # a single-row lookup comes back squeezed
+        train_items = self.trainset[idx.cpu()][0].view_as(items).to(items.device)
+        output = Model.exclude(self.classifier(train_items), self.val_seen if seen is None else seen, idx)
+        metrics = {}
+        for n in ns:
+            metrics[f'precision_at_{n}'] = Model.precision_at_n(output, items, n=n)
+            metrics[f'recall_at_{n}'] = Model.recall_at_n(output, items, n=n)
+            metrics[f'ndcg_at_{n}'] = Model.ndcg(output, items, n=n)
+        return metrics
+
+    def validation_step(self, batch, batch_idx):
+        for name, value in self.evaluate(batch).items():
+            self.log(name, value, prog_bar=True, on_step=False, on_epoch=True)
 
     def test_step(self, batch, batch_idx):
-        items, idx = batch
-        train_items = self.trainset[idx.cpu()][0].to(items.device)
-        val_items = self.valset[idx.cpu()][0].to(items.device)
-        output = self.classifier(train_items)
-        output[torch.where(train_items == 1)] = -float('inf')
-        output[torch.where(val_items == 1)] = -float('inf')
-
-        precision_at_5 = Model.precision_at_n(output, items, n=5)
-        recall_at_5 = Model.recall_at_n(output, items, n=5)
-        ndcg_at_5 = Model.ndcg(output, items, n=5)
-        self.log('precision_at_5', precision_at_5, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('recall_at_5', recall_at_5, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('ndcg_at_5', ndcg_at_5, prog_bar=True, on_step=False, on_epoch=True)
-
-        precision_at_20 = Model.precision_at_n(output, items, n=20)
-        recall_at_20 = Model.recall_at_n(output, items, n=20)
-        ndcg_at_20 = Model.ndcg(output, items, n=20)
-        self.log('precision_at_20', precision_at_20, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('recall_at_20', recall_at_20, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('ndcg_at_20', ndcg_at_20, prog_bar=True, on_step=False, on_epoch=True)
+        for name, value in self.evaluate(batch, ns=(5, 20), seen=self.test_seen).items():
+            self.log(name, value, prog_bar=True, on_step=False, on_epoch=True)
 
     def configure_optimizers(self):
         opt = torch.optim.Adam(self.classifier.parameters(), lr=0.0001, weight_decay=0.00001)
@@ -0,0 +1,62 @@
+"""Compress the output layer of a trained generator by truncated SVD and report the metric loss per rank.
+
+Splits are rebuilt like train.py (same seed and ratios) and the metrics are computed on the test split:
+
+    python compress.py --checkpoint model.ckpt --ranks 16 32 64 128 256
+"""
+import argparse
+import copy
+
+import pytorch_lightning as pl
+import torch
+from torch.utils.data import DataLoader
+
+from dataset2 import MovieLensDataset
+from model_cfwgan import CFWGAN, FactorizedLinear
+from validation import evaluate
+
+
+def compress_generator(generator, rank):
+    """Copy of `generator` whose Linear(1024, num_items) output layer is replaced by its rank-`rank` SVD."""
+    if isinstance(generator.mlp_repeat[-2], FactorizedLinear):
+        raise ValueError('the output layer of the generator is already factorized')
+    generator = copy.deepcopy(generator)
+    generator.mlp_repeat[-2] = FactorizedLinear.from_linear(generator.mlp_repeat[-2], rank)
+    return generator
+
+
+def parameters(module):
+    return sum(p.numel() for p in module.parameters())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--config', default='movielens-100k')
+    parser.add_argument('--ranks', type=int, nargs='+', default=[16, 32, 64, 128, 256])
+    parser.add_argument('--seed', type=int, default=12323)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--output', default=None, help='save the generator state dict of the last rank here')
+    args = parser.parse_args()
+
+    pl.seed_everything(args.seed)
+    dataset = MovieLensDataset(args.ratings)
+    train, test = dataset.split_train_test(test_size=0.4)
+    test, val = test.split_train_test(test_size=0.5)
+    model = CFWGAN.load_from_checkpoint(args.checkpoint, trainset=train.share_memory(),
+                                        num_items=dataset.item_count, config=args.config)
+    loader = DataLoader(test.share_memory(), args.batch_size)
+
+    dense = evaluate(model, loader, ns=(5, 20))
+    size = parameters(model.generator)
+    print(f'{"rank":>6} {"params":>10} {"ratio":>6} ' + ' '.join(f'{name:>16}' for name in dense))
+    print(f'{"dense":>6} {size:>10} {1:>6.2f} ' + ' '.join(f'{value:>16.4f}' for value in dense.values()))
+    dense_generator = model.generator
+    for rank in args.ranks:
+        model.generator = compress_generator(dense_generator, rank)
+        metrics = evaluate(model, loader, ns=(5, 20))
+        print(f'{rank:>6} {parameters(model.generator):>10} {size / parameters(model.generator):>6.2f} '
+              + ' '.join(f'{value:>9.4f} ({value - dense[name]:+.3f})' for name, value in metrics.items()))
+    if args.output is not None:
+        torch.save(model.generator.state_dict(), args.output)
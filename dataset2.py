@@ -1,5 +1,6 @@
 import copy
-import random
+import json
+import os
 
 import numpy as np
 import pandas as pd
@@ -10,6 +11,111 @@ from sklearn.preprocessing import LabelEncoder
 from torch.utils.data import Dataset
 
 
+class SharedCSRDataset(Dataset):
+    """Rows of a CSR matrix whose arrays live in shared memory or in memory-mapped .npy files.
+
+    Only the three CSR arrays are kept, so handing it to DataLoader workers sends a handle (a shared memory
+    segment or a directory) instead of a copy of the dataframes, encoders and scipy matrix. Indexing behaves
+    like `MovieLensDataset`."""
+
+    files = ('indptr.npy', 'indices.npy', 'data.npy')
+
+    def __init__(self, indptr, indices, data, shape, path=None):
+        self.tensors = None
+        self.indptr, self.indices, self.data = indptr, indices, data
+        self.shape = tuple(shape)
+        self.path = path
+        self.item_count = self.shape[-1]
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        matrix = scipy.sparse.csr_matrix(matrix, copy=True)
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+        tensors = (torch.from_numpy(matrix.indptr.astype(np.int64)).share_memory_(),
+                   torch.from_numpy(matrix.indices.astype(np.int64)).share_memory_(),
+                   torch.from_numpy(matrix.data.astype(np.float32)).share_memory_())
+        dataset = cls(*[t.numpy() for t in tensors], matrix.shape)
+        dataset.tensors = tensors
+        return dataset
+
+    @classmethod
+    def load(cls, path):
+        indptr, indices, data = [np.load(os.path.join(path, f), mmap_mode='r') for f in cls.files]
+        with open(os.path.join(path, 'shape.json'), 'r') as file:
+            shape = json.load(file)
+        return cls(indptr, indices, data, shape, path=path)
+
+    @staticmethod
+    def save_matrix(matrix, path):
+        matrix = scipy.sparse.csr_matrix(matrix, copy=True)
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+        os.makedirs(path, exist_ok=True)
+        arrays = (matrix.indptr.astype(np.int64), matrix.indices.astype(np.int64), matrix.data.astype(np.float32))
+        for f, a in zip(SharedCSRDataset.files, arrays):
+            np.save(os.path.join(path, f), a)
+        with open(os.path.join(path, 'shape.json'), 'w') as file:
+            json.dump(list(matrix.shape), file)
+
+    def save(self, path):
+        SharedCSRDataset.save_matrix(self.to_scipy(), path)
+
+    @property
+    def matrix(self):
+        return self.to_scipy()
+
+    def to_scipy(self):
+        return scipy.sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    def __getstate__(self):
+        # memory-mapped: workers reopen the files; shared memory: torch pickles the tensors as shm handles
+        if self.path is not None:
+            return {'path': self.path}
+        return {'tensors': self.tensors, 'shape': self.shape}
+
+    def __setstate__(self, state):
+        if 'path' in state:
+            self.__dict__.update(SharedCSRDataset.load(state['path']).__dict__)
+        else:
+            self.__init__(*[t.numpy() for t in state['tensors']], state['shape'])
+            self.tensors = state['tensors']
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _positions(self, idx):
+        idx = np.atleast_1d(np.asarray(idx))
+        # negative ids count from the end like a list, anything outside [-n, n) is an error, never another row
+        if ((idx < -self.shape[0]) | (idx >= self.shape[0])).any():
+            raise IndexError(f'row index out of range for {self.shape[0]} rows')
+        idx = idx % self.shape[0]
+        starts, ends = self.indptr[idx], self.indptr[idx + 1]
+        counts = ends - starts
+        total = counts.sum()
+        row = np.repeat(np.arange(len(idx)), counts)
+        pos = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        return row, pos
+
+    def nonzero(self, idx):
+        """Batch positions and column indices of the nonzero entries of rows `idx`."""
+        row, pos = self._positions(idx)
+        return row, self.indices[pos]
+
+    def rows(self, idx):
+        idx = np.atleast_1d(np.asarray(idx))
+        out = np.zeros((len(idx), self.shape[1]), dtype=np.float32)
+        row, pos = self._positions(idx)
+        out[row, self.indices[pos]] = self.data[pos]
+        return torch.from_numpy(out)
+
+    def __getitem__(self, idx):
+        if torch.is_tensor(idx):
+            idx = idx.numpy()
+        data = self.rows(idx).squeeze()
+        return data, idx
+
+
 class MovieLensDataset(Dataset):
     def __init__(self, path, item_based=False):
         with open(path, 'r') as file:
@@ -20,6 +126,16 @@ class MovieLensDataset(Dataset):
             sep = '::'
             names = ['userId', 'movieId', 'rating', 'timestamp']
         df = pd.read_csv(path, sep=sep, names=names)
+        self._build(df, item_based)
+
+    @classmethod
+    def from_dataframe(cls, df, item_based=False):
+        """Dataset of a ratings dataframe with `userId`/`movieId` columns, without going through a file."""
+        dataset = cls.__new__(cls)
+        dataset._build(df.copy(), item_based)
+        return dataset
+
+    def _build(self, df, item_based):
         self.movie_le = LabelEncoder()
         self.user_le = LabelEncoder()
         df['userId'] = self.user_le.fit_transform(df['userId'])
@@ -27,12 +143,44 @@ class MovieLensDataset(Dataset):
         self.dataframe = df
 
         row, column, data = df['userId'], df['movieId'], np.ones(len(df))
-        self.matrix = scipy.sparse.csr_matrix((data, (row, column)))
+        self.item_based = item_based
         if item_based:
-            self.matrix = self.matrix.transpose()
+            # build item rows directly: transposing a CSR gives a CSC matrix whose row slicing is slow
+            row, column = column, row
+        self.matrix = scipy.sparse.csr_matrix((data, (row, column)))
 
         self.item_count = self.matrix.shape[-1]
 
+    @classmethod
+    def load(cls, path):
+        """Rebuild a dataset saved with `save` without parsing the ratings file; arrays are memory-mapped."""
+        dataset = cls.__new__(cls)
+        with open(os.path.join(path, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        rows = SharedCSRDataset.load(os.path.join(path, 'matrix'))
+        dataset.matrix = rows.to_scipy()
+        dataset.item_based = meta['item_based']
+        dataset.item_count = dataset.matrix.shape[-1]
+        dataset.user_le, dataset.movie_le = LabelEncoder(), LabelEncoder()
+        dataset.user_le.classes_ = np.load(os.path.join(path, 'users.npy'), allow_pickle=True)
+        dataset.movie_le.classes_ = np.load(os.path.join(path, 'movies.npy'), allow_pickle=True)
+        dataset.dataframe = pd.DataFrame({c: np.load(os.path.join(path, f'column_{c}.npy'), mmap_mode='r')
+                                          for c in meta['columns']}, copy=False)
+        return dataset
+
+    def save(self, path):
+        SharedCSRDataset.save_matrix(self.matrix, os.path.join(path, 'matrix'))
+        np.save(os.path.join(path, 'users.npy'), self.user_le.classes_)
+        np.save(os.path.join(path, 'movies.npy'), self.movie_le.classes_)
+        for c in self.dataframe.columns:
+            np.save(os.path.join(path, f'column_{c}.npy'), self.dataframe[c].to_numpy())
+        with open(os.path.join(path, 'meta.json'), 'w') as file:
+            json.dump({'columns': list(self.dataframe.columns), 'item_based': self.item_based}, file)
+
+    def share_memory(self):
+        """Lightweight view of the rows to hand to DataLoader workers, see `SharedCSRDataset`."""
+        return SharedCSRDataset.from_matrix(self.matrix)
+
     def __getitem__(self, idx):
         data = self.matrix[idx]
         data = torch.tensor(data.toarray().squeeze()).float()
@@ -42,19 +190,23 @@ class MovieLensDataset(Dataset):
         return self.matrix.shape[0]
 
     def split_train_test(self, test_size=0.2):
-        train_matrix = self.matrix.copy()
-        nz = train_matrix.nonzero()
-        nz = list(zip(*[x.tolist() for x in nz]))
-        test = random.sample(nz, round(len(nz) * test_size))
-        test = tuple(np.array(x) for x in zip(*test))
-        test_matrix = sparse.csr_matrix(train_matrix.shape)
-        test_matrix[test] = 1
-        train_matrix[test] = 0
-
-        train = copy.deepcopy(self)
-        train.matrix = train_matrix
-
-        test = copy.deepcopy(self)
-        test.matrix = test_matrix
-
-        return train, test
\ No newline at end of file
+        """Hold out `test_size` of the interactions. Both splits keep the orientation (user or item rows) and
+        the CSR format of this dataset."""
+        matrix = self.matrix.tocoo()
+        nz = matrix.data != 0
+        row, col = matrix.row[nz], matrix.col[nz]
+        test = np.zeros(len(row), dtype=bool)
+        test[np.random.choice(len(row), round(len(row) * test_size), replace=False)] = True
+
+        train_matrix = sparse.csr_matrix((np.ones((~test).sum()), (row[~test], col[~test])), shape=matrix.shape)
+        test_matrix = sparse.csr_matrix((np.ones(test.sum()), (row[test], col[test])), shape=matrix.shape)
+        return self._with_matrix(train_matrix), self._with_matrix(test_matrix)
+
+    def _with_matrix(self, matrix):
+        current, self.matrix = self.matrix, None
+        try:
+            dataset = copy.deepcopy(self)
+        finally:
+            self.matrix = current
+        dataset.matrix = matrix
+        return dataset
@@ -0,0 +1,135 @@
+"""Export of the whole scoring path (history input, generator, seen-item masking, top-k, item ids) as one
+TorchScript or ONNX graph, runnable without the Python model code.
+
+    python export.py --checkpoint model.ckpt --ratings movielens/ml-100k/ratings.csv --k 10 --output exported
+
+writes exported/scoring.pt (torch.jit.load) and exported/scoring.onnx, checks both against the eager
+`recommender.recommend` and prints their latencies. The ONNX parity check and timing need onnxruntime.
+"""
+import argparse
+import os
+import time
+
+import torch
+from torch import nn
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+from dataset2 import MovieLensDataset
+from model_cfwgan import CFWGAN
+from recommender import recommend
+
+
+class ScoringGraph(nn.Module):
+    """Top-`k` unseen items of multi-hot histories (B, num_items), returned as (scores, indices, item_ids).
+
+    `item_ids` maps item indices to raw movie ids (e.g. `movie_le.classes_`), defaulting to the indices."""
+
+    def __init__(self, generator, num_items, k=10, item_ids=None):
+        super().__init__()
+        self.generator = generator
+        self.num_items = num_items
+        self.k = k
+        item_ids = torch.arange(num_items) if item_ids is None else torch.as_tensor(item_ids, dtype=torch.int64)
+        self.register_buffer('item_ids', item_ids)
+
+    def rank(self, items):
+        scores = self.generator(items).masked_fill(items > 0, -float('inf'))
+        scores, indices = torch.topk(scores, self.k, dim=-1)
+        return scores, indices, self.item_ids[indices]
+
+    def forward(self, items):
+        return self.rank(items)
+
+
+class IndexScoringGraph(ScoringGraph):
+    """`ScoringGraph` taking histories as item index lists (B, L), right-padded with -1."""
+
+    def forward(self, history):
+        # padding goes to an extra column that is dropped, which keeps the scatter valid for every entry
+        history = torch.where(history < 0, torch.full_like(history, self.num_items), history)
+        items = torch.zeros(history.shape[0], self.num_items + 1, device=history.device)
+        items = items.scatter(1, history, torch.ones_like(history, dtype=items.dtype))
+        return self.rank(items[:, :self.num_items])
+
+
+def export_torchscript(graph, path):
+    scripted = torch.jit.script(graph.eval())
+    scripted.save(path)
+    return scripted
+
+
+def export_onnx(graph, path, example):
+    torch.onnx.export(graph.eval(), (example,), path, input_names=['history'],
+                      output_names=['scores', 'indices', 'item_ids'], opset_version=17, dynamo=False,
+                      dynamic_axes={'history': {0: 'batch', 1: 'length'}, 'scores': {0: 'batch'},
+                                    'indices': {0: 'batch'}, 'item_ids': {0: 'batch'}})
+
+
+def to_index_lists(items):
+    """(B, L) item index lists, right-padded with -1, of multi-hot histories."""
+    items = items.view(-1, items.shape[-1])
+    lengths = (items > 0).sum(-1)
+    history = torch.full((items.shape[0], max(int(lengths.max()), 1)), -1, dtype=torch.int64)
+    rows, cols = torch.nonzero(items > 0, as_tuple=True)
+    starts = torch.cumsum(lengths, 0) - lengths
+    history[rows, torch.arange(len(rows)) - starts[rows]] = cols
+    return history
+
+
+def check_parity(outputs, generator, items, atol=1e-5):
+    """Whether exported (scores, indices, ...) outputs match the eager `recommend` on multi-hot `items`."""
+    scores, indices = recommend(generator, items, outputs[0].shape[-1])
+    exported_scores, exported_indices = (torch.as_tensor(o) for o in outputs[:2])
+    # ties (and -inf fillers) may be ordered differently: compare the items only where scores are distinct
+    distinct = torch.isfinite(scores)
+    distinct[:, 1:] &= (scores[:, 1:] - scores[:, :-1]).abs() > atol
+    distinct[:, :-1] &= (scores[:, 1:] - scores[:, :-1]).abs() > atol
+    return (torch.allclose(exported_scores, scores, atol=atol)
+            and torch.equal(exported_indices[distinct], indices[distinct]))
+
+
+def latency(fn, repeats=50):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--config', default='movielens-100k')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--output', default='exported')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 64])
+    args = parser.parse_args()
+
+    dataset = MovieLensDataset(args.ratings)
+    rows = dataset.share_memory()
+    generator = CFWGAN.load_from_checkpoint(args.checkpoint, trainset=None, num_items=dataset.item_count,
+                                            config=args.config).generator.eval()
+    os.makedirs(args.output, exist_ok=True)
+    graph = IndexScoringGraph(generator, dataset.item_count, args.k, dataset.movie_le.classes_.astype('int64'))
+    scripted = export_torchscript(graph, os.path.join(args.output, 'scoring.pt'))
+    onnx_path = os.path.join(args.output, 'scoring.onnx')
+    export_onnx(graph, onnx_path, to_index_lists(rows[torch.arange(2)][0]))
+    session = onnxruntime.InferenceSession(onnx_path) if onnxruntime is not None else None
+
+    print(f'{"batch":>6} {"eager ms":>10} {"script ms":>10} {"onnx ms":>10} parity')
+    for batch_size in args.batch_sizes:
+        items = rows[torch.arange(min(batch_size, len(rows)))][0].view(-1, dataset.item_count)
+        history = to_index_lists(items)
+        with torch.no_grad():
+            parity = check_parity(scripted(history), generator, items)
+            times = [latency(lambda: recommend(generator, items, args.k)),
+                     latency(lambda: scripted(history))]
+        if session is not None:
+            parity &= check_parity(session.run(None, {'history': history.numpy()}), generator, items)
+            times.append(latency(lambda: session.run(None, {'history': history.numpy()})))
+        print(f'{batch_size:>6} ' + ' '.join(f'{t:>10.2f}' for t in times) + f'{"":>{11 * (3 - len(times))}} {parity}')
@@ -0,0 +1,67 @@
+import numpy as np
+import torch
+
+
+class GenreIndex:
+    """Genre bitmask of every item, to restrict recommendations to genre filters without per-item Python work.
+
+    Item `i` holds an int64 whose bit `g` is set when it belongs to `genres[g]`. A filter is a dict with up to
+    three genre lists: items must have `all` of the first, at least one of `any` and none of `exclude`, e.g.
+    {'all': ['Comedy'], 'exclude': ['Horror']}. Filters become boolean item masks to apply before `topk`."""
+
+    def __init__(self, bits, genres):
+        self.bits = bits
+        self.genres = list(genres)
+        self.positions = {genre: g for g, genre in enumerate(self.genres)}
+
+    @classmethod
+    def from_movies(cls, movies_dataframe, item_ids, separator='|'):
+        """Index of the items whose raw movie ids are `item_ids` (in item index order), read from the `genres`
+        or `genre` column of a movies dataframe. Items missing from the dataframe have no genre."""
+        column = 'genres' if 'genres' in movies_dataframe else 'genre'
+        split = movies_dataframe[column].fillna('').str.split(separator, regex=False)
+        genres = sorted({genre for genres in split for genre in genres if genre})
+        if len(genres) > 63:
+            raise ValueError(f'{len(genres)} genres do not fit in an int64 bitmask')
+        positions = {genre: g for g, genre in enumerate(genres)}
+        movie_bits = np.array([sum(1 << positions[genre] for genre in set(genres) if genre) for genres in split],
+                              dtype=np.int64)
+        order = np.argsort(movies_dataframe['movieId'].to_numpy(), kind='stable')
+        movie_ids = movies_dataframe['movieId'].to_numpy()[order]
+        item_ids = np.asarray(item_ids)
+        position = np.minimum(np.searchsorted(movie_ids, item_ids), len(movie_ids) - 1)
+        bits = np.where(movie_ids[position] == item_ids, movie_bits[order][position], 0)
+        return cls(torch.from_numpy(bits.astype(np.int64)), genres)
+
+    def bitmask(self, genres):
+        genres = [genres] if isinstance(genres, str) else genres
+        unknown = [genre for genre in genres if genre not in self.positions]
+        if unknown:
+            raise KeyError(f'unknown genres {unknown}')
+        return sum(1 << self.positions[genre] for genre in genres)
+
+    def encode(self, filters):
+        """(all, any, exclude) bitmasks of a list of filters, as an int64 tensor of shape (len(filters), 3)."""
+        return torch.tensor([[self.bitmask(f.get('all', ())), self.bitmask(f.get('any', ())),
+                              self.bitmask(f.get('exclude', ()))] for f in filters], dtype=torch.int64)
+
+    def mask(self, filters):
+        """Items allowed by each filter, a boolean tensor of shape (len(filters), num_items). A single filter
+        gives a (num_items,) mask."""
+        if isinstance(filters, dict):
+            return self.mask([filters])[0]
+        # batches share few distinct filters: build their masks once and index them
+        encoded, inverse = torch.unique(self.encode(filters), dim=0, return_inverse=True)
+        encoded = encoded.to(self.bits.device)
+        bits = self.bits.unsqueeze(0)
+        required, anyone, excluded = (encoded[:, i:i + 1] for i in range(3))
+        masks = (((bits & required) == required) & (((bits & anyone) != 0) | (anyone == 0))
+                 & ((bits & excluded) == 0))
+        return masks[inverse.to(masks.device)]
+
+    def genres_of(self, item):
+        bits = int(self.bits[item])
+        return [genre for g, genre in enumerate(self.genres) if bits >> g & 1]
+
+    def __len__(self):
+        return len(self.bits)
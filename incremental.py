@@ -0,0 +1,170 @@
+"""Warm-start retraining of a trained CFWGAN or Classifier after new ratings, users and items arrived.
+
+The num_items-wide layers are grown to the new catalogue (trained weights are kept for the known items, new items
+get freshly initialized weights) and the model is fine-tuned on the users whose history changed, mixed with a
+replayed sample of the others so the rest of the catalogue is not forgotten. The interactions the checkpoint was
+trained on all stay in the training set; only the ones that arrived since are held out for validation and test:
+
+    python incremental.py --checkpoint model.ckpt --old-ratings old/ratings.csv --ratings new/ratings.csv
+
+`--old-ratings` is the ratings file the checkpoint was trained on, or a dataset directory written by
+`MovieLensDataset.save`; only its encoders and matrix are used.
+"""
+import argparse
+import os
+
+import numpy as np
+import pytorch_lightning as pl
+import scipy.sparse
+import torch
+from pytorch_lightning.callbacks import ModelCheckpoint
+from torch.utils.data import DataLoader, Subset
+
+from chunking import chunk_size
+from classifier_model import Model
+from dataset2 import MovieLensDataset, SharedCSRDataset
+from model_cfwgan import CFWGAN, FactorizedLinear
+from validation import ScheduledValidation, stratified_subsample
+
+
+def mapping(old_encoder, new_encoder):
+    """Old index of every class of `new_encoder` (a fitted LabelEncoder), -1 for the classes it did not know."""
+    old_classes, new_classes = old_encoder.classes_, new_encoder.classes_
+    position = np.minimum(np.searchsorted(old_classes, new_classes), len(old_classes) - 1)
+    return np.where(old_classes[position] == new_classes, position, -1)
+
+
+# layers of each model whose input (weight columns) or output (weight rows and bias) is num_items wide
+INPUT_LAYERS = {CFWGAN: ('generator.mlp_repeat.0', 'discriminator.candidate', 'discriminator.condition'),
+                Model: ('classifier.mlp_tower.0',)}
+OUTPUT_LAYERS = {CFWGAN: ('generator.mlp_repeat.6',), Model: ('classifier.mlp_tower.3',)}
+
+
+def item_axes(model):
+    """Item dimension of every num_items-wide parameter of `model`, by state_dict key."""
+    axes = {}
+    for name in INPUT_LAYERS[type(model)]:
+        layer = model.get_submodule(name)
+        axes[name + ('.down.weight' if isinstance(layer, FactorizedLinear) else '.weight')] = 1
+    for name in OUTPUT_LAYERS[type(model)]:
+        if isinstance(model.get_submodule(name), FactorizedLinear):
+            name += '.up'
+        axes[name + '.weight'] = 0
+        if model.get_submodule(name).bias is not None:
+            axes[name + '.bias'] = 0
+    return axes
+
+
+def warm_start(model, state_dict, items, old_count):
+    """Load `state_dict`, trained on a catalogue of `old_count` items, into `model` built for the new catalogue.
+
+    `items` maps every new item index to its old index or -1 (see `mapping`). The item dimension of the input and
+    output layers (see `item_axes`) is remapped; positions of new items keep the initialization of `model`."""
+    state_dict = dict(state_dict)
+    if 'discriminator.mlp_tower.0.weight' in state_dict:
+        model.discriminator._split_concatenated_layer(state_dict, 'discriminator.')
+    items = torch.as_tensor(items)
+    known = torch.where(items >= 0)[0]
+    target = model.state_dict()
+    for key, dim in item_axes(model).items():
+        source = state_dict[key]
+        if source.shape[dim] != old_count:
+            raise ValueError(f'{key} has {source.shape[dim]} items in the checkpoint, expected {old_count}')
+        grown = target[key].clone()
+        grown.index_copy_(dim, known, source.index_select(dim, items[known]))
+        state_dict[key] = grown
+    model.load_state_dict(state_dict)
+    return model
+
+
+def previous_interactions(old, new, users=None, items=None):
+    """Interactions of `old` in the index space of `new`, dropping the users and items `new` no longer has."""
+    users = mapping(old.user_le, new.user_le) if users is None else users
+    items = mapping(old.movie_le, new.movie_le) if items is None else items
+    # old indices -> new indices: the inverse of the mappings, restricted to the classes that still exist
+    user_index = np.full(len(old.user_le.classes_), -1)
+    user_index[users[users >= 0]] = np.where(users >= 0)[0]
+    item_index = np.full(len(old.movie_le.classes_), -1)
+    item_index[items[items >= 0]] = np.where(items >= 0)[0]
+    previous = old.matrix.tocoo()
+    row, col = user_index[previous.row], item_index[previous.col]
+    kept = (row >= 0) & (col >= 0) & (previous.data != 0)
+    return scipy.sparse.csr_matrix((np.ones(kept.sum()), (row[kept], col[kept])), shape=new.matrix.shape)
+
+
+def changed_users(old, new, users=None, items=None):
+    """Rows of `new` whose history differs from the one they had in `old` (new users included)."""
+    users = mapping(old.user_le, new.user_le) if users is None else users
+    difference = (new.matrix != 0) != (previous_interactions(old, new, users, items) != 0)
+    return np.union1d(np.flatnonzero(difference.getnnz(axis=1)), np.flatnonzero(users < 0))
+
+
+def split_new_interactions(old, new, test_sizes=(0.2, 0.2), users=None, items=None):
+    """Training matrix and one held-out matrix per `test_sizes` fraction of the interactions of `new` that `old`
+    did not have. The interactions of `old` the model was trained on all stay in the training matrix, so none of
+    them is evaluated."""
+    current = new.matrix.tocoo()
+    nz = current.data != 0
+    row, col = current.row[nz], current.col[nz]
+    arrived = np.flatnonzero(np.asarray(previous_interactions(old, new, users, items)[row, col] == 0).ravel())
+    arrived = arrived[np.random.permutation(len(arrived))]
+    split = np.zeros(len(row), dtype=int)
+    bounds = np.round(np.cumsum([0] + list(test_sizes)) * len(arrived)).astype(int)
+    for part, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]), 1):
+        split[arrived[start:stop]] = part
+    return [scipy.sparse.csr_matrix((np.ones((split == part).sum()), (row[split == part], col[split == part])),
+                                    shape=current.shape) for part in range(len(test_sizes) + 1)]
+
+
+def fine_tune_rows(num_rows, changed, replay=0.1, seed=0):
+    """Changed rows plus a `replay` fraction of the unchanged ones."""
+    unchanged = np.setdiff1d(np.arange(num_rows), changed)
+    rng = np.random.RandomState(seed)
+    replayed = rng.choice(unchanged, round(len(unchanged) * replay), replace=False)
+    return np.sort(np.concatenate([changed, replayed]))
+
+
+def load_dataset(path):
+    return MovieLensDataset.load(path) if os.path.isdir(path) else MovieLensDataset(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--old-ratings', required=True)
+    parser.add_argument('--ratings', required=True)
+    parser.add_argument('--model', choices=['cfwgan', 'classifier'], default='cfwgan')
+    parser.add_argument('--config', default='movielens-100k')
+    parser.add_argument('--replay', type=float, default=0.1)
+    parser.add_argument('--max-steps', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--validate-every', type=int, default=100)
+    parser.add_argument('--eval-budget-mb', type=float, default=1024, help='sets the evaluation batch size')
+    parser.add_argument('--seed', type=int, default=12323)
+    args = parser.parse_args()
+
+    pl.seed_everything(args.seed)
+    old, dataset = load_dataset(args.old_ratings), load_dataset(args.ratings)
+    items = mapping(old.movie_le, dataset.movie_le)
+    changed = changed_users(old, dataset, items=items)
+    print(f'{len(changed)} changed users, {(items < 0).sum()} new items')
+
+    train, val, test = split_new_interactions(old, dataset, (0.2, 0.2), items=items)
+    train_rows, val_rows = SharedCSRDataset.from_matrix(train), SharedCSRDataset.from_matrix(val)
+    if args.model == 'cfwgan':
+        model = CFWGAN(train_rows, dataset.item_count, alpha=0.1, s_zr=0.5, s_pm=0.5, d_steps=5, g_steps=1,
+                       config=args.config)
+    else:
+        model = Model(train_rows, val_rows, SharedCSRDataset.from_matrix(test), dataset.item_count)
+    warm_start(model, torch.load(args.checkpoint, map_location='cpu')['state_dict'], items, len(old.movie_le.classes_))
+
+    rows = fine_tune_rows(len(train_rows), changed, args.replay, args.seed)
+    eval_batch_size = chunk_size(dataset.item_count, args.eval_budget_mb)
+    validation = ScheduledValidation(DataLoader(stratified_subsample(val_rows), eval_batch_size),
+                                     DataLoader(val_rows, eval_batch_size),
+                                     every_n_steps=args.validate_every, monitor='ndcg_at_5')
+    model_checkpoint = ModelCheckpoint(monitor='ndcg_at_5', save_top_k=1, save_weights_only=True, mode='max',
+                                       every_n_train_steps=args.validate_every,
+                                       filename='incremental-{step}-{ndcg_at_5:.4f}')
+    trainer = pl.Trainer(max_steps=args.max_steps, callbacks=[validation, model_checkpoint], log_every_n_steps=5)
+    trainer.fit(model, DataLoader(Subset(train_rows, rows), args.batch_size, shuffle=True))
@@ -1,3 +1,4 @@
+import contextlib
 import itertools
 import math
 import random
@@ -44,10 +45,77 @@ class MLPRepeat(nn.Module):
         return self.sequential(x)
 
 
+class FactorizedLinear(nn.Module):
+    """Rank-`rank` factorization of nn.Linear(in_features, out_features), computed as in -> rank -> out.
+    It needs rank * (in_features + out_features) weights instead of in_features * out_features."""
+
+    def __init__(self, in_features, out_features, rank, bias=True):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.rank = rank
+        self.down = nn.Linear(in_features, rank, bias=False)
+        self.up = nn.Linear(rank, out_features, bias=bias)
+
+    @classmethod
+    def from_linear(cls, linear, rank):
+        """Best rank-`rank` approximation of a trained `linear` (truncated SVD of its weight). The rank is at most
+        min(in_features, out_features), the rank of the weight."""
+        if not 0 < rank <= min(linear.in_features, linear.out_features):
+            raise ValueError(f'rank {rank} out of range for a {linear.in_features}x{linear.out_features} linear layer, '
+                             f'expected 1 to {min(linear.in_features, linear.out_features)}')
+        layer = cls(linear.in_features, linear.out_features, rank, bias=linear.bias is not None)
+        u, s, vh = torch.linalg.svd(linear.weight.detach(), full_matrices=False)
+        s = s[:rank].sqrt()
+        with torch.no_grad():
+            layer.down.weight.copy_(s[:, None] * vh[:rank])
+            layer.up.weight.copy_(u[:, :rank] * s)
+            if linear.bias is not None:
+                layer.up.bias.copy_(linear.bias)
+        return layer
+
+    def forward(self, x):
+        return self.up(self.down(x))
+
+
+def parse_config(config):
+    """Hidden size and rank of the num_items-wide layers (None for dense) of a config.
+
+    `config` is a name ('movielens-100k' uses 256 hidden units, any other 512) or a dict such as
+    {'name': 'movielens-1m', 'rank': 128} to factorize the num_items-wide layers."""
+    if isinstance(config, dict):
+        name, rank = config.get('name', 'movielens-100k'), config.get('rank')
+    else:
+        name, rank = config, None
+    return 256 if name == 'movielens-100k' else 512, rank
+
+
+def linear(in_features, out_features, rank=None, bias=True):
+    if rank is None:
+        return nn.Linear(in_features, out_features, bias=bias)
+    return FactorizedLinear(in_features, out_features, rank, bias=bias)
+
+
+def input_columns(layer, x, columns):
+    """`layer(full)` for a num_items-wide input `full` that is zero outside `columns`, given `x = full[:, columns]`."""
+    if isinstance(layer, FactorizedLinear):
+        return layer.up(x @ layer.down.weight[:, columns].t())
+    output = x @ layer.weight[:, columns].t()
+    return output + layer.bias if layer.bias is not None else output
+
+
+def output_columns(layer, x, columns):
+    """`layer(x)[:, columns]` of a num_items-wide output layer, computing only those outputs."""
+    if isinstance(layer, FactorizedLinear):
+        x, layer = layer.down(x), layer.up
+    output = x @ layer.weight[columns].t()
+    return output + layer.bias[columns] if layer.bias is not None else output
+
+
 class Generator(nn.Module):
     def __init__(self, num_items, config='movielens-100k'):
         super().__init__()
-        n = 256 if config == 'movielens-100k' else 512
+        n, rank = parse_config(config)
         self.mlp_repeat = nn.Sequential(
             nn.Linear(num_items, n),
             nn.ReLU(True),
@@ -55,19 +123,69 @@ class Generator(nn.Module):
             nn.ReLU(True),
             nn.Linear(512, 1024),
             nn.ReLU(True),
-            nn.Linear(1024, num_items),
+            linear(1024, num_items, rank),
             nn.Sigmoid()
         )
 
     def forward(self, items):
         return self.mlp_repeat(items)
 
+    def forward_columns(self, items, columns):
+        """`forward(full)[:, columns]` for histories `full` whose items all are in `columns`, given
+        `items = full[:, columns]`. Only the weights of those columns are read."""
+        hidden = self.mlp_repeat[1:-2](input_columns(self.mlp_repeat[0], items, columns))
+        return torch.sigmoid(output_columns(self.mlp_repeat[-2], hidden, columns))
+
+    def trunk(self, items):
+        """Hidden representation fed to the num_items-wide output layer."""
+        return self.mlp_repeat[:-2](items)
+
+    # costs of reading a weight row in a matmul and of copying it out in a gather, in matmul row products
+    # (measured on CPU: the gather allocates and fills a new tensor, a batch of one makes the matmul memory-bound)
+    READ_ROW_COST, GATHER_ROW_COST = 20, 200
+
+    def score_candidates(self, items, candidates):
+        """Scores of the `candidates` (B, C) item indices only, gathering their output layer rows instead of
+        computing every item. Negative indices are padding and score 0.
+
+        Of the full output layer, a matmul over the distinct candidates of the batch and a per-row (B, C, hidden)
+        gather, the cheapest for the batch is used, so the cost never exceeds a full forward and follows the
+        candidate count when the catalogue is large."""
+        output = self.mlp_repeat[-2]
+        hidden = self.trunk(items)
+        if isinstance(output, FactorizedLinear):
+            hidden, output = output.down(hidden), output.up
+        padding = candidates < 0
+        candidates = candidates.clamp(min=0)
+        unique, inverse = torch.unique(candidates, return_inverse=True)
+        batch, per_row = candidates.shape
+        costs = (output.weight.shape[0] * (batch + self.READ_ROW_COST),
+                 len(unique) * (batch + self.GATHER_ROW_COST), batch * per_row * self.GATHER_ROW_COST)
+        path = costs.index(min(costs))
+        if path == 0:
+            logits = (hidden @ output.weight.t()).gather(1, candidates)
+        elif path == 1:
+            logits = (hidden @ output.weight[unique].t()).gather(1, inverse)
+        else:
+            logits = torch.einsum('bh,bch->bc', hidden, output.weight[candidates])
+        if output.bias is not None:
+            logits = logits + output.bias[candidates]
+        return torch.sigmoid(logits).masked_fill(padding, 0.)
+
 
 class Discriminator(nn.Module):
+    """Critic of (candidate, condition) pairs of num_items-wide vectors.
+
+    The first layer over the concatenation of both is split into a `candidate` and a `condition` projection, so
+    the condition, identical for the real, fake and interpolated calls of a critic step, can be encoded once
+    with `encode_condition` and passed to every call."""
+
     def __init__(self, num_items, config='movielens-100k'):
         super().__init__()
+        _, rank = parse_config(config)
+        self.candidate = linear(num_items, 1024, rank)
+        self.condition = linear(num_items, 1024, rank, bias=False)
         self.mlp_tower = nn.Sequential(
-            nn.Linear(2 * num_items, 1024),
             nn.ReLU(True),
             nn.Linear(1024, 128),
             nn.ReLU(True),
@@ -75,15 +193,46 @@ class Discriminator(nn.Module):
             nn.ReLU(True),
             nn.Linear(16, 1),
         )
-
-    def forward(self, generator_output, item_full):
-        x = torch.cat([generator_output, item_full], dim=-1)
-        return self.mlp_tower(x)
+        self._register_load_state_dict_pre_hook(self._split_concatenated_layer)
+
+    def encode_condition(self, items, sparse=False):
+        """First-layer projection of the conditioning items. With `sparse`, the binary `items` go through a sparse
+        matmul that only reads the weight columns of their nonzero entries."""
+        if not sparse:
+            return self.condition(items)
+        items = items if items.is_sparse else items.to_sparse()
+        if isinstance(self.condition, FactorizedLinear):
+            return self.condition.up(torch.sparse.mm(items, self.condition.down.weight.t()))
+        return torch.sparse.mm(items, self.condition.weight.t())
+
+    def forward(self, generator_output, item_full, condition=None, columns=None):
+        """With `columns`, both inputs are restricted to those columns and taken as zero elsewhere."""
+        if columns is not None:
+            if condition is None:
+                condition = input_columns(self.condition, item_full, columns)
+            return self.mlp_tower(input_columns(self.candidate, generator_output, columns) + condition)
+        if condition is None:
+            condition = self.encode_condition(item_full)
+        return self.mlp_tower(self.candidate(generator_output) + condition)
+
+    def _split_concatenated_layer(self, state_dict, prefix, *args):
+        # checkpoints from before the split have a single Linear(2 * num_items, 1024) at mlp_tower.0
+        weight = state_dict.pop(prefix + 'mlp_tower.0.weight', None)
+        if weight is None:
+            return
+        candidate, condition = weight.chunk(2, dim=1)
+        state_dict[prefix + 'candidate.weight'] = candidate
+        state_dict[prefix + 'candidate.bias'] = state_dict.pop(prefix + 'mlp_tower.0.bias')
+        state_dict[prefix + 'condition.weight'] = condition
+        for old, new in ((2, 1), (4, 3), (6, 5)):
+            for name in ('weight', 'bias'):
+                state_dict[f'{prefix}mlp_tower.{new}.{name}'] = state_dict.pop(f'{prefix}mlp_tower.{old}.{name}')
 
 
 class CFWGAN(pl.LightningModule):
     def __init__(self, trainset, num_items, alpha=0.04, s_zr=0.6, s_pm=0.6, g_steps=1, d_steps=1, lambd=10,
-                 debug=False, config='movielens-100k'):
+                 debug=False, config='movielens-100k', sparse_condition=False, negative_sampler=None,
+                 sampled_output=False):
         super().__init__()
         self.generator = Generator(num_items, config)
         self.discriminator = Discriminator(num_items, config)
@@ -96,6 +245,10 @@ class CFWGAN(pl.LightningModule):
         self.debug = debug
         self.step_gd = 0
         self.lambd = lambd
+        self.sparse_condition = sparse_condition
+        self.negative_sampler = negative_sampler
+        self.sampled_output = sampled_output
+        self.phase_timer = None
         self.automatic_optimization = False
 
     def forward(self, item_full):
@@ -103,6 +256,8 @@ class CFWGAN(pl.LightningModule):
         return x
 
     def negative_sampling(self, items):
+        if self.negative_sampler is not None:
+            return self.negative_sampler(items, self.s_zr), self.negative_sampler(items, self.s_pm)
         zr_all, pm_all = [], []
         for i in range(items.shape[0]):
             where_zeros = torch.where(items[i] == 0)[0].tolist()
@@ -120,85 +275,128 @@ class CFWGAN(pl.LightningModule):
 
         return torch.stack(zr_all, dim=0), torch.stack(pm_all, dim=0)
 
-    def training_step(self, batch, batch_idx, optimizer_idx):
+    def phase(self, name):
+        """Times a phase of the training step when a `profiling.ThroughputMonitor` is attached."""
+        return self.phase_timer.phase(name) if self.phase_timer is not None else contextlib.nullcontext()
+
+    def sampled_columns(self, items, zr, max_fraction=0.5):
+        """Items that are positive or ZR negatives in the batch: the only generator outputs the losses read.
+
+        None (dense training) when they exceed `max_fraction` of the catalogue, as on small catalogues or with
+        fractional `s_zr`, where gathering the columns costs more than it saves."""
+        columns = torch.nonzero((items != 0).any(0) | (zr != 0).any(0)).squeeze(1)
+        return columns if len(columns) <= max_fraction * items.shape[1] else None
+
+    def _generate(self, items, columns):
+        return self.generator(items) if columns is None else self.generator.forward_columns(items, columns)
+
+    def _condition(self, items, columns):
+        if columns is None:
+            return self.discriminator.encode_condition(items, sparse=self.sparse_condition)
+        return input_columns(self.discriminator.condition, items, columns)
+
+    def discriminator_loss(self, items, columns=None):
+        """WGAN-GP critic loss of a batch, returned with the norms of the penalized gradients.
+
+        With `columns` (see `sampled_columns`) every num_items-wide tensor is restricted to them. The real and
+        fake terms are unchanged, the gradient penalty is taken over the interpolates of those columns only."""
+        if columns is not None:
+            items = items[:, columns]
+        with self.phase('d_generate'):
+            # the critic update never reads generator gradients: no generator graph to build and backpropagate
+            with torch.no_grad():
+                fake_data = self._generate(items, columns)
+            condition = self._condition(items, columns)
+        with self.phase('gradient_penalty'):
+            epsilon = torch.rand(items.shape[0], 1, device=items.device)
+            x_hat = (epsilon * fake_data + (1 - epsilon) * items).requires_grad_(True)
+            d_hat = self.discriminator(x_hat, items, condition, columns)
+            gradients = torch.autograd.grad(outputs=d_hat, inputs=x_hat,
+                                            grad_outputs=torch.ones_like(d_hat),
+                                            create_graph=True, retain_graph=True, only_inputs=True)[0]
+            gradients_norm = gradients.norm(2, dim=-1)
+        with self.phase('d_forward'):
+            d_loss = torch.mean(self.discriminator(fake_data * items, items, condition, columns)
+                                - self.discriminator(items, items, condition, columns)
+                                + self.lambd * (gradients_norm - 1) ** 2)
+        return d_loss, gradients_norm
+
+    def generator_loss(self, items, zr, columns=None):
+        """Adversarial loss plus the `alpha`-weighted reconstruction of the ZR negatives, with the generator output
+        (restricted to `columns` when given, the loss being the same)."""
+        if columns is not None:
+            items, zr = items[:, columns], zr[:, columns]
+        with self.phase('g_forward'):
+            generator_output = self._generate(items, columns)
+            condition = self._condition(items, columns)
+            g_loss = torch.mean(-self.discriminator(generator_output * items, items, condition, columns))
+            if self.alpha != 0:
+                g_loss += self.alpha * torch.sum(((items - generator_output) ** 2) * zr) / items.shape[0]
+        return g_loss, generator_output
+
+    def training_step(self, batch, batch_idx):
         # access your optimizers with use_pl_optimizer=False. Default is True
         opt_g, opt_d = self.optimizers(use_pl_optimizer=True)
 
         items, idx = batch
-        zr, k = self.negative_sampling(items)
+        with self.phase('negative_sampling'):
+            zr, k = self.negative_sampling(items)
+            columns = self.sampled_columns(items, zr) if self.sampled_output else None
 
         # train discriminator
         # Measure discriminator's ability to classify real from generated samples
         # discriminator loss is the average of these
         if self.step_gd % (self.g_steps + self.d_steps) >= self.g_steps:
-            fake_data = self.generator(items)
-            epsilon = torch.rand(items.shape[0], 1, device=items.device)
-            x_hat = epsilon * fake_data + (1 - epsilon) * items
-            d_hat = self.discriminator(x_hat, items)
-            gradients = torch.autograd.grad(outputs=d_hat, inputs=x_hat,
-                                            grad_outputs=torch.ones_like(d_hat),
-                                            create_graph=True, retain_graph=True, only_inputs=True)[0]
-            gradients_norm = gradients.norm(2, dim=-1)
-            d_loss = torch.mean(self.discriminator(fake_data * items, items) - self.discriminator(items, items)
-                                + self.lambd * (gradients_norm - 1) ** 2)
-
+            d_loss, gradients_norm = self.discriminator_loss(items, columns)
             self.log('d_loss', d_loss, prog_bar=True, on_step=True, on_epoch=False)
             self.log('gradients_norm', gradients_norm.mean(), prog_bar=False, on_step=True, on_epoch=False)
-            opt_d.zero_grad()
-            self.manual_backward(d_loss, opt_d, retain_graph=True)
-            opt_d.step()
+            # includes the double backward through the gradient penalty
+            with self.phase('d_backward'):
+                opt_d.zero_grad()
+                self.manual_backward(d_loss, retain_graph=True)
+            with self.phase('optimizer_step'):
+                opt_d.step()
 
         # train generator
         else:
             # adversarial loss is binary cross-entropy
-            generator_output = self.generator(items)
-            g_loss = torch.mean(-self.discriminator(generator_output * items, items))
-            if self.alpha != 0:
-                g_loss += self.alpha * torch.sum(((items - generator_output) ** 2) * zr) / items.shape[0]
+            g_loss, generator_output = self.generator_loss(items, zr, columns)
             self.log('g_loss', g_loss, prog_bar=True, on_step=True, on_epoch=False)
             self.log('output_mean', generator_output.mean(), prog_bar=False, on_step=True, on_epoch=False)
-            opt_g.zero_grad()
-            self.manual_backward(g_loss, opt_g, retain_graph=True)
-            opt_g.step()
+            with self.phase('g_backward'):
+                opt_g.zero_grad()
+                self.manual_backward(g_loss, retain_graph=True)
+            with self.phase('optimizer_step'):
+                opt_g.step()
         self.step_gd += 1
 
-    def validation_step(self, batch, batch_idx):
+    def evaluate(self, batch, ns=(5,)):
+        """Ranking metrics of one evaluation batch, ranking only the items held out in `batch`."""
         items, idx = batch
-        train_items = self.trainset[idx.cpu()][0].to(items.device)
+        # a single-row lookup comes back squeezed
+        train_items = self.trainset[idx.cpu()][0].view_as(items).to(items.device)
         generator_output = self.generator(train_items)
         generator_output[torch.where(items == 0)] = -float('inf')
-        precision_at_5 = CFWGAN.precision_at_n(generator_output, items, n=5)
-        recall_at_5 = CFWGAN.recall_at_n(generator_output, items, n=5)
-        ndcg_at_5 = CFWGAN.ndcg(generator_output, items, n=5)
-        self.log('precision_at_5', precision_at_5, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('recall_at_5', recall_at_5, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('ndcg_at_5', ndcg_at_5, prog_bar=True, on_step=False, on_epoch=True)
+        metrics = {}
+        for n in ns:
+            metrics[f'precision_at_{n}'] = CFWGAN.precision_at_n(generator_output, items, n=n)
+            metrics[f'recall_at_{n}'] = CFWGAN.recall_at_n(generator_output, items, n=n)
+            metrics[f'ndcg_at_{n}'] = CFWGAN.ndcg(generator_output, items, n=n)
         if self.debug:
             self._info_debug = CFWGAN.precision_at_n(generator_output, items, n=2)
+        return metrics
 
-    def test_step(self, batch, batch_idx):
-        items, idx = batch
-        train_items = self.trainset[idx.cpu()][0].to(items.device)
-        generator_output = self.generator(train_items)
-        generator_output[torch.where(items == 0)] = -float('inf')
-
-        precision_at_5 = CFWGAN.precision_at_n(generator_output, items, n=5)
-        recall_at_5 = CFWGAN.recall_at_n(generator_output, items, n=5)
-        ndcg_at_5 = CFWGAN.ndcg(generator_output, items, n=5)
-        self.log('precision_at_5', precision_at_5, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('recall_at_5', recall_at_5, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('ndcg_at_5', ndcg_at_5, prog_bar=True, on_step=False, on_epoch=True)
+    def validation_step(self, batch, batch_idx):
+        for name, value in self.evaluate(batch).items():
+            self.log(name, value, prog_bar=True, on_step=False, on_epoch=True)
 
-        precision_at_20 = CFWGAN.precision_at_n(generator_output, items, n=20)
-        recall_at_20 = CFWGAN.recall_at_n(generator_output, items, n=20)
-        ndcg_at_20 = CFWGAN.ndcg(generator_output, items, n=20)
-        self.log('precision_at_20', precision_at_20, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('recall_at_20', recall_at_20, prog_bar=True, on_step=False, on_epoch=True)
-        self.log('ndcg_at_20', ndcg_at_20, prog_bar=True, on_step=False, on_epoch=True)
+    def test_step(self, batch, batch_idx):
+        for name, value in self.evaluate(batch, ns=(5, 20)).items():
+            self.log(name, value, prog_bar=True, on_step=False, on_epoch=True)
 
     def configure_optimizers(self):
-        opt_g = torch.optim.Adam(self.generator.parameters(), lr=0.0001, betas=(0, 0.9))
-        opt_d = torch.optim.Adam(self.discriminator.parameters(), lr=0.0001, betas=(0, 0.9))
+        opt_g = torch.optim.Adam(self.generator.parameters(), lr=0.0001, betas=(0., 0.9))
+        opt_d = torch.optim.Adam(self.discriminator.parameters(), lr=0.0001, betas=(0., 0.9))
         return [opt_g, opt_d], []
 
     @staticmethod
@@ -2,6 +2,15 @@ import pytorch_lightning as pl
 from torch import nn
 import math
 import torch
+from torch.nn.utils.rnn import PackedSequence
+
+
+def embed(embedding, history):
+    """Embeds item indices, keeping a `PackedSequence` packed so the LSTM never sees padding."""
+    if isinstance(history, PackedSequence):
+        return history._replace(data=embedding(history.data))
+    return embedding(history)
+
 
 class Generator(nn.Module):
     def __init__(self, user_emb, item_emb, noise_size, history_summarizer):
@@ -17,7 +26,7 @@ class Generator(nn.Module):
         self.history_summarizer = history_summarizer
 
     def forward(self, user_id, history, noise):
-        user_emb, item_emb = self.user_emb(user_id), self.item_emb(history)
+        user_emb, item_emb = self.user_emb(user_id), embed(self.item_emb, history)
         summary = self.history_summarizer(item_emb)
         x = torch.cat([user_emb, summary, noise], dim=-1)
         x = self.sequential(x)
@@ -35,7 +44,7 @@ class Discriminator(nn.Module):
                                         nn.Linear(size_l2//2, 1))
 
     def forward(self, user_id, generator_output, history):
-        user_emb, item_emb = self.user_emb(user_id), self.item_emb(history)
+        user_emb, item_emb = self.user_emb(user_id), embed(self.item_emb, history)
         summary = self.history_summarizer(item_emb)
         x = torch.cat([user_emb, summary, generator_output], dim=-1)
         x = self.sequential(x)
@@ -48,8 +57,8 @@ class HistorySummarizer(nn.Module):
         self.linear = nn.Linear(hidden_size, embedding_size)
 
     def forward(self, history):
-        x = self.lstm(history)
-        x = self.linear(x)
+        _, (h, _) = self.lstm(history)
+        x = self.linear(h[-1])
         return x
 
 
@@ -0,0 +1,82 @@
+import numpy as np
+import torch
+
+
+class AliasTable:
+    """Walker/Vose alias table: O(n) construction, then O(1) draws from a fixed discrete distribution."""
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        prob = np.ones(n)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1]
+        large = [i for i in range(n) if scaled[i] >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+        self.prob = torch.from_numpy(prob).float()
+        self.alias = torch.from_numpy(alias).long()
+
+    def __len__(self):
+        return len(self.prob)
+
+    def to(self, device):
+        self.prob, self.alias = self.prob.to(device), self.alias.to(device)
+        return self
+
+    def sample(self, *shape, generator=None):
+        column = torch.randint(len(self.prob), shape, generator=generator, device=self.prob.device)
+        keep = torch.rand(shape, generator=generator, device=self.prob.device) < self.prob[column]
+        return torch.where(keep, column, self.alias[column])
+
+
+class NegativeSampler:
+    """Vectorized ZR/PM negative sampling for `model_cfwgan.CFWGAN`.
+
+    Items are drawn with probability proportional to `popularity ** power` (0 gives uniform draws), popularity
+    being the interaction count of each item in the training CSR. A whole batch is drawn at once from an alias
+    table; draws hitting an observed or already chosen item are rejected and the missing ones redrawn, so the
+    cost depends on the number of negatives rather than on the catalogue size. `n` is a count, or like
+    `CFWGAN.s_zr` a fraction of the unobserved items of each row."""
+
+    def __init__(self, trainset, power=0., smoothing=1., max_rounds=20):
+        self.popularity = np.bincount(trainset.matrix.indices, minlength=trainset.item_count)
+        self.power = power
+        self.max_rounds = max_rounds
+        self.weights = torch.from_numpy((self.popularity + smoothing) ** power).float()
+        self.table = AliasTable(self.weights)
+
+    def __call__(self, items, n):
+        if self.table.prob.device != items.device:
+            self.table.to(items.device)
+        observed = items != 0
+        if isinstance(n, float):
+            needed = torch.round((~observed).sum(-1) * n).long()
+        else:
+            needed = torch.full((items.shape[0],), n, dtype=torch.long, device=items.device)
+        needed = torch.minimum(needed, (~observed).sum(-1))
+        mask = torch.zeros_like(items)
+        for _ in range(self.max_rounds):
+            missing = needed - mask.sum(-1).long()
+            if not missing.any():
+                return mask
+            draws = self.table.sample(items.shape[0], int(missing.max()))
+            valid = ~(observed.gather(1, draws) | (mask.gather(1, draws) != 0))
+            valid &= valid.cumsum(-1) <= missing.unsqueeze(-1)
+            rows = valid.nonzero(as_tuple=True)[0]
+            mask[rows, draws[valid]] = 1
+        return self._fill(mask, observed, needed)
+
+    def _fill(self, mask, observed, needed):
+        # rows still short after the rejection rounds (large fractions of the catalogue) sample exactly
+        weights = self.weights.to(mask.device)
+        for i in torch.where(mask.sum(-1).long() < needed)[0].tolist():
+            free = weights * ~(observed[i] | (mask[i] != 0))
+            missing = int(needed[i] - mask[i].sum())
+            mask[i, torch.multinomial(free, missing)] = 1
+        return mask
@@ -0,0 +1,160 @@
+import contextlib
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import pytorch_lightning as pl
+import torch
+
+from validation import ScheduledValidation
+
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def current_rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    with open('/proc/self/statm', 'r') as file:
+        return int(file.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10
+
+
+class PeakMemory:
+    """Peak process RSS above the starting RSS while the block runs, sampled by a thread."""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.peak = 0.
+
+    def __enter__(self):
+        self.start = current_rss_mb()
+        self.peak = self.start
+        self._running = True
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while self._running:
+            self.peak = max(self.peak, current_rss_mb())
+            time.sleep(self.interval)
+
+    def __exit__(self, *args):
+        self._running = False
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+    @property
+    def delta(self):
+        return self.peak - self.start
+
+
+class PhaseTimer:
+    """Wall time accumulated per named phase of a training step.
+
+    Models wrap their phases in `with self.phase(name):`, which is a no-op until a `ThroughputMonitor` attaches
+    a timer. When `trace` is set the phases are also recorded as `torch.profiler` ranges."""
+
+    def __init__(self, synchronize=False):
+        self.synchronize = synchronize
+        self.trace = False
+        self.times = defaultdict(float)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        record = torch.profiler.record_function(name) if self.trace else contextlib.nullcontext()
+        with record:
+            if self.synchronize:
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            yield
+            if self.synchronize:
+                torch.cuda.synchronize()
+            self.times[name] += time.perf_counter() - start
+
+    def reset(self):
+        times, self.times = dict(self.times), defaultdict(float)
+        return times
+
+
+class ThroughputMonitor(pl.Callback):
+    """Logs where the time of each training step goes, next to the losses.
+
+    Logged every step: `time/data` (fetching and moving the batch), `time/<phase>` for every phase the model
+    timed (see `PhaseTimer`), `time/step`, `samples_per_sec` and `peak_rss_mb`. Set `trace_steps=(first, last)`
+    to dump a `torch.profiler` chrome trace of these global steps to `trace_path`. Time spent in
+    `validation.ScheduledValidation` callbacks is left out of the step and data times, whatever the callback order."""
+
+    def __init__(self, trace_steps=None, trace_path='trace.json'):
+        self.trace_steps = trace_steps
+        self.trace_path = trace_path
+        self.timer = None
+        self.profiler = None
+        self._batch_end = None
+        self._batch_start = None
+        self._data_time = 0.
+        self._validation_time = 0.
+
+    def on_fit_start(self, trainer, pl_module):
+        self.timer = PhaseTimer(synchronize=pl_module.device.type == 'cuda')
+        pl_module.phase_timer = self.timer
+
+    def on_fit_end(self, trainer, pl_module):
+        self._stop_trace()
+        pl_module.phase_timer = None
+
+    @staticmethod
+    def validation_time(trainer):
+        return sum(c.validation_time for c in trainer.callbacks if isinstance(c, ScheduledValidation))
+
+    def _since_validation(self, trainer):
+        # validation run by other callbacks since the last call
+        total = ThroughputMonitor.validation_time(trainer)
+        elapsed, self._validation_time = total - self._validation_time, total
+        return elapsed
+
+    def on_train_epoch_start(self, trainer, pl_module):
+        self._batch_end = time.perf_counter()
+        self._since_validation(trainer)
+
+    def on_train_batch_start(self, trainer, pl_module, batch, batch_idx, dataloader_idx=0):
+        self._batch_start = time.perf_counter()
+        self._data_time = self._batch_start - self._batch_end - self._since_validation(trainer)
+        self.timer.reset()
+        if self.trace_steps is not None and trainer.global_step == self.trace_steps[0] and self.profiler is None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True)
+            self.profiler.__enter__()
+            self.timer.trace = True
+
+    def on_train_batch_end(self, trainer, pl_module, outputs, batch, batch_idx, dataloader_idx=0):
+        self._batch_end = time.perf_counter()
+        step_time = self._batch_end - self._batch_start - self._since_validation(trainer)
+        batch_size = len(batch[0])
+        metrics = {f'time/{name}': value for name, value in self.timer.reset().items()}
+        metrics.update({'time/data': self._data_time, 'time/step': step_time,
+                        'samples_per_sec': batch_size / (self._data_time + step_time), 'peak_rss_mb': peak_rss_mb()})
+        for name, value in metrics.items():
+            pl_module.log(name, value, prog_bar=name == 'samples_per_sec', on_step=True, on_epoch=False)
+        if self.profiler is not None and trainer.global_step >= self.trace_steps[1]:
+            self._stop_trace()
+
+    def _stop_trace(self):
+        if self.profiler is None:
+            return
+        self.profiler.__exit__(None, None, None)
+        self.profiler.export_chrome_trace(self.trace_path)
+        self.profiler = None
+        self.timer.trace = False
@@ -1,12 +1,65 @@
+import contextlib
+
 import torch
 import numpy as np
+from chunking import SCORING, chunk_size, chunks
 from dataset import MovieLensDataset
+from genre_index import GenreIndex
 from model_cfwgan import CFWGAN
 
+
+def recommend(generator, vectors, k=10, allowed=None):
+    """Top-`k` unseen items for each multi-hot history in `vectors`, as (scores, indices).
+
+    `allowed` is an optional boolean item mask, (num_items,) or one row per history, such as
+    `GenreIndex.mask`; rows with fewer than `k` allowed items are completed with -inf scores."""
+    with torch.no_grad():
+        excluded = vectors > 0
+        if allowed is not None:
+            excluded = excluded | ~allowed
+        scores = generator(vectors).masked_fill(excluded, -float('inf'))
+        return torch.topk(scores, k, dim=-1)
+
+
+def recommend_all(generator, histories, k=10, budget_mb=256, memory=None):
+    """Top-`k` unseen (scores, indices) of every user of `histories`, a `SharedCSRDataset`, scored in chunks of
+    users whose dense tensors fit in `budget_mb` (see `chunking`). With a `chunking.ChunkMemory` as `memory`, the
+    peak memory of every chunk is recorded in it."""
+    num_users, num_items = histories.shape
+    device = next(generator.parameters()).device
+    scores = torch.empty(num_users, k, device=device)
+    indices = torch.empty(num_users, k, dtype=torch.int64, device=device)
+    for start, stop in chunks(num_users, chunk_size(num_items, budget_mb, SCORING)):
+        with memory.chunk() if memory is not None else contextlib.nullcontext():
+            vectors = histories.rows(np.arange(start, stop)).to(device)
+            scores[start:stop], indices[start:stop] = recommend(generator, vectors, k)
+    return scores, indices
+
+
+def pad_candidates(candidates, device=None):
+    """(B, C) tensor of ragged candidate lists, right-padded with -1."""
+    width = max(max((len(c) for c in candidates), default=0), 1)
+    padded = torch.full((len(candidates), width), -1, dtype=torch.int64, device=device)
+    for row, items in enumerate(candidates):
+        padded[row, :len(items)] = torch.as_tensor(items, dtype=torch.int64)
+    return padded
+
+
+def rerank(generator, vectors, candidates):
+    """Scores of each history's candidate items, in the order given, as a list of 1-D tensors. Only the output
+    layer rows of the candidates are computed, so the cost follows the candidate count, not the catalogue size."""
+    with torch.no_grad():
+        padded = pad_candidates(candidates, vectors.device)
+        scores = generator.score_candidates(vectors.view(len(candidates), -1), padded)
+        return [scores[row, :len(items)] for row, items in enumerate(candidates)]
+
+
 class Recommender():
-    def __init__(self, path_to_model=None, ratings_file=None, movies_file=None):
+    def __init__(self, path_to_model=None, ratings_file=None, movies_file=None, cache=None):
         self.dataset = MovieLensDataset(ratings_file=ratings_file, movies_file=movies_file)
         self.model = self.load_model(path_to_model)
+        self.cache = cache
+        self._genre_index = None
 
     def load_model(self, path):
         if path is None or path == '':
@@ -17,6 +70,31 @@ class Recommender():
     def generate(self, vector):
         return self.model.forward(torch.tensor(vector))
 
+    @property
+    def genre_index(self):
+        if self._genre_index is None:
+            item_ids = [self.dataset.movie_dict[i] for i in range(self.dataset.item_count)]
+            self._genre_index = GenreIndex.from_movies(self.dataset.movies_dataframe, item_ids)
+        return self._genre_index
+
+    def recommend(self, vector, k=10, user=None, genres=None):
+        """Top-`k` unseen (scores, indices) of a history vector, served from `cache` for a known `user`.
+        `genres` is a `GenreIndex` filter such as {'any': ['Comedy']}; filtered results are not cached."""
+        vector = torch.as_tensor(vector, dtype=torch.float)
+        allowed = self.genre_index.mask(genres) if genres is not None else None
+
+        def compute():
+            scores, indices = recommend(self.model.generator, vector.view(1, -1), k, allowed)
+            return scores[0], indices[0]
+
+        if self.cache is None or user is None or genres is not None:
+            return compute()
+        return self.cache.get_or_compute(user, vector, k, compute)
+
+    def rerank(self, vector, candidates):
+        """Generator scores of the `candidates` item indices of one history vector."""
+        return rerank(self.model.generator, torch.as_tensor(vector, dtype=torch.float), [candidates])[0]
+
     def filter_vector(self, input, output):
         filtered = input * output
         return filtered
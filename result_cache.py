@@ -0,0 +1,97 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+class RecommendationCache:
+    """Bounded LRU cache of top-k results per user, with an optional time to live.
+
+    An entry is stored with a fingerprint of the user's interaction history and only served while the history
+    fingerprint still matches, so a new interaction invalidates it. A cached top-k also serves any smaller k.
+    Results (tuples of tensors or lists) are copied in and out, so callers may modify what they get in place.
+    All operations take a lock and can be shared by a thread pool."""
+
+    def __init__(self, max_size=10000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def fingerprint(items):
+        """Digest of a history given as item indices, in any order and with repeats."""
+        if torch.is_tensor(items):
+            items = items.detach().cpu().numpy()
+        items = np.asarray(items)
+        if items.size and items.dtype.kind not in 'iu':
+            raise TypeError(f'item indices must be integers, got {items.dtype}')
+        return hashlib.blake2b(np.unique(items.astype(np.int64)).tobytes(), digest_size=8).digest()
+
+    @staticmethod
+    def vector_fingerprint(vector):
+        """`fingerprint` of a history given as a multi-hot vector, of any dtype."""
+        if torch.is_tensor(vector):
+            vector = vector.detach().cpu().numpy()
+        return RecommendationCache.fingerprint(np.flatnonzero(vector))
+
+    @staticmethod
+    def _copy(result, k):
+        return tuple(r[:k].clone() if torch.is_tensor(r) else list(r[:k]) for r in result)
+
+    def get(self, user, fingerprint, k):
+        with self._lock:
+            entry = self._entries.get(user)
+            if entry is not None:
+                entry_fingerprint, entry_k, expires, result = entry
+                if entry_fingerprint != fingerprint or (expires is not None and expires < time.monotonic()):
+                    del self._entries[user]
+                    self.invalidations += 1
+                elif entry_k >= k:
+                    self._entries.move_to_end(user)
+                    self.hits += 1
+                    return RecommendationCache._copy(result, k)
+            self.misses += 1
+            return None
+
+    def put(self, user, fingerprint, k, result):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[user] = (fingerprint, k, expires, RecommendationCache._copy(result, k))
+            self._entries.move_to_end(user)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, user, vector, k, compute):
+        """Cached result for `user`, or `compute()` stored under the fingerprint of its multi-hot history `vector`."""
+        fingerprint = RecommendationCache.vector_fingerprint(vector)
+        result = self.get(user, fingerprint, k)
+        if result is None:
+            result = compute()
+            self.put(user, fingerprint, k, result)
+        return result
+
+    def invalidate(self, user=None):
+        """Drop the entry of `user`, or every entry."""
+        with self._lock:
+            if user is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop(user, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,77 @@
+import numpy as np
+import torch
+from torch.nn.utils.rnn import pack_sequence
+from torch.utils.data import Dataset, Sampler
+
+
+class SequenceDataset(Dataset):
+    """Timestamp-ordered interaction history of every user, for the sequential models of `model_experimental`.
+
+    All histories live in one flat `items` tensor, user `u` owning `items[offsets[u]:offsets[u + 1]]`, so memory is
+    linear in the number of interactions and an item returns a view rather than a copy. Expects the encoded
+    `userId`/`movieId` columns of `dataset2.MovieLensDataset.dataframe`."""
+
+    def __init__(self, dataframe, min_length=1, item_count=None):
+        users = dataframe['userId'].to_numpy()
+        order = np.lexsort((dataframe['timestamp'].to_numpy(), users))
+        self.items = torch.from_numpy(dataframe['movieId'].to_numpy()[order].astype(np.int64))
+        counts = np.bincount(users)
+        self.offsets = torch.from_numpy(np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+        self.users = np.flatnonzero(counts >= min_length)
+        self.item_count = item_count or int(dataframe['movieId'].max()) + 1
+
+    @classmethod
+    def from_dataset(cls, dataset, min_length=1):
+        return cls(dataset.dataframe, min_length=min_length, item_count=dataset.item_count)
+
+    def lengths(self):
+        offsets = self.offsets.numpy()
+        return offsets[self.users + 1] - offsets[self.users]
+
+    def __len__(self):
+        return len(self.users)
+
+    def __getitem__(self, idx):
+        user = int(self.users[idx])
+        return user, self.items[self.offsets[user]:self.offsets[user + 1]]
+
+
+class LengthBucketSampler(Sampler):
+    """Batch sampler grouping histories of similar length.
+
+    Indices are shuffled, cut into buckets of `batch_size * bucket_multiplier`, sorted by length inside each
+    bucket and batched; the batches are shuffled again. Packed batches then hold little length variance, which
+    keeps the LSTM time steps full."""
+
+    def __init__(self, lengths, batch_size, shuffle=True, bucket_multiplier=50, drop_last=False, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.bucket_size = batch_size * bucket_multiplier
+        self.drop_last = drop_last
+        self.rng = np.random.RandomState(seed)
+
+    def __iter__(self):
+        indices = self.rng.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = indices[start:start + self.bucket_size]
+            bucket = bucket[np.argsort(self.lengths[bucket], kind='stable')]
+            batches.extend(bucket[i:i + self.batch_size] for i in range(0, len(bucket), self.batch_size))
+        if self.drop_last:
+            batches = [b for b in batches if len(b) == self.batch_size]
+        if self.shuffle:
+            self.rng.shuffle(batches)
+        return iter([b.tolist() for b in batches])
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.lengths) // self.batch_size
+        return sum(-(-min(self.bucket_size, len(self.lengths) - s) // self.batch_size)
+                   for s in range(0, len(self.lengths), self.bucket_size))
+
+
+def collate(batch):
+    """User ids and a `PackedSequence` of their item histories."""
+    users, histories = zip(*batch)
+    return torch.tensor(users), pack_sequence(list(histories), enforce_sorted=False)
@@ -0,0 +1,258 @@
+"""Asyncio front end that coalesces concurrent single-user requests into batched generator forwards.
+
+Requests are queued and served together once `max_batch_size` of them are waiting or `max_latency_ms` has passed
+since the first one. The JSON-lines TCP server takes {"user": 12, "k": 10} or {"items": [3, 51], "k": 10}
+(item indices of the history) and answers {"items": [...], "scores": [...]}. With `--movies`, requests may add a
+genre filter such as "genres": {"all": ["Comedy"], "exclude": ["Horror"]} (see `genre_index.GenreIndex`):
+
+    python serving.py --checkpoint model.ckpt --ratings movielens/ml-100k/ratings.csv --port 8765
+"""
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import torch
+
+from dataset2 import MovieLensDataset, SharedCSRDataset
+from genre_index import GenreIndex
+from model_cfwgan import CFWGAN
+from recommender import recommend
+from result_cache import RecommendationCache
+
+
+class BatchingRecommender:
+    """Micro-batching wrapper around a generator.
+
+    `histories` (a `dataset2.SharedCSRDataset` or `MovieLensDataset`) resolves user ids to their interaction
+    vectors; requests can also carry the vector itself. Requests are checked before they are queued, so an
+    invalid one fails alone instead of failing its whole batch. The forward pass runs in a worker thread so the
+    event loop keeps accepting requests while a batch is scored. With a `result_cache.RecommendationCache`, user id
+    requests whose history did not change are answered without queuing. `histories` is a snapshot: cached results
+    are only invalidated by their TTL, or by a new snapshot given to `update_histories`. Genre filtered requests need a
+    `genre_index`; their filters are checked with the rest of the request and masked inside the batch."""
+
+    def __init__(self, generator, histories=None, num_items=None, k=10, max_batch_size=64, max_latency_ms=5.,
+                 cache=None, genre_index=None):
+        self.generator = generator.eval()
+        self.cache = cache
+        self.genre_index = genre_index
+        self.histories = histories
+        self.num_items = num_items or histories.item_count
+        self.k = k
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.requests = 0
+        self._task = None
+        self._batch = []
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._serve())
+
+    async def stop(self):
+        """Stops serving. Requests still queued or in the batch being formed or scored fail with RuntimeError."""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        pending = self._batch
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for *_, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError('recommender stopped'))
+        self._batch = []
+        self.executor.shutdown()
+
+    def update_histories(self, histories):
+        """Serve from a new snapshot of the same items. Cached results of users whose history changed are dropped
+        on their next request, their fingerprint no longer matching."""
+        if histories.item_count != self.num_items:
+            raise ValueError(f'{histories.item_count} items, the recommender serves {self.num_items}')
+        self.histories = histories
+
+    def history_items(self, user):
+        """Item indices of the history of `user`, read from the sparse row."""
+        if isinstance(self.histories, SharedCSRDataset):
+            return self.histories.nonzero(user)[1]
+        return self.histories.matrix[user].indices
+
+    def history_vector(self, items):
+        """Multi-hot history vector of a list of item indices, or ValueError if one is outside the catalogue."""
+        if any(isinstance(item, bool) or not isinstance(item, (int, np.integer)) for item in items):
+            raise ValueError(f'item indices must be integers, got {items!r}')
+        outside = [item for item in items if not 0 <= item < self.num_items]
+        if outside:
+            raise ValueError(f'item indices {outside} outside [0, {self.num_items})')
+        vector = torch.zeros(self.num_items)
+        vector[list(items)] = 1
+        return vector
+
+    def check(self, user, vector, k, genres=None):
+        """The request's history vector (None for a user id), or ValueError/IndexError if it is invalid."""
+        if genres is not None:
+            if self.genre_index is None:
+                raise ValueError('genre filters need a genre index')
+            if not isinstance(genres, dict) or not set(genres) <= {'all', 'any', 'exclude'}:
+                raise ValueError(f'a genre filter is a dict of "all", "any" and "exclude" lists, got {genres!r}')
+            try:
+                self.genre_index.encode([genres])
+            except KeyError as e:
+                raise ValueError(e.args[0]) from None
+        if (user is None) == (vector is None):
+            raise ValueError('pass exactly one of user and vector')
+        if isinstance(k, bool) or not isinstance(k, int) or not 0 < k <= self.num_items:
+            raise ValueError(f'k must be an integer in [1, {self.num_items}], got {k!r}')
+        if user is not None:
+            if self.histories is None:
+                raise ValueError('user ids need histories')
+            if isinstance(user, bool) or not isinstance(user, (int, np.integer)):
+                raise ValueError(f'user must be an integer id, got {user!r}')
+            if not 0 <= user < len(self.histories):
+                raise IndexError(f'unknown user {user}')
+            return None
+        vector = torch.as_tensor(vector, dtype=torch.float)
+        if vector.shape != (self.num_items,):
+            raise ValueError(f'history vector of shape {tuple(vector.shape)}, expected ({self.num_items},)')
+        return vector
+
+    async def recommend(self, user=None, vector=None, k=None, genres=None):
+        """Top-`k` (indices, scores) for a user id or a multi-hot history vector, optionally genre filtered."""
+        if self._task is None or self._task.done():
+            raise RuntimeError('recommender is not running')
+        k = self.k if k is None else k
+        vector = self.check(user, vector, k, genres)
+        cached = self.cache is not None and user is not None and genres is None
+        if cached:
+            fingerprint = RecommendationCache.fingerprint(self.history_items(user))
+            result = self.cache.get(user, fingerprint, k)
+            if result is not None:
+                return result
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((user, vector, k, genres, future))
+        result = await future
+        if cached:
+            self.cache.put(user, fingerprint, k, result)
+        return result
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # kept on the instance so `stop` can fail the requests of an unfinished batch
+            self._batch = batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                # not asyncio.wait_for, which can swallow the cancellation of `stop` when an item arrives with it
+                getter = asyncio.ensure_future(self.queue.get())
+                try:
+                    await asyncio.wait({getter}, timeout=timeout)
+                finally:
+                    taken = getter.done()
+                    if taken:
+                        batch.append(getter.result())
+                    else:
+                        getter.cancel()
+                if not taken:
+                    break
+            try:
+                results = await loop.run_in_executor(self.executor, self._score, batch)
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._batch = []
+                continue
+            for (*_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self._batch = []
+
+    def _score(self, batch):
+        vectors = torch.zeros(len(batch), self.num_items)
+        users = [(i, user) for i, (user, *_) in enumerate(batch) if user is not None]
+        if users:
+            rows, ids = zip(*users)
+            vectors[list(rows)] = self.histories[torch.tensor(ids)][0].view(len(ids), -1)
+        for i, (_, vector, *_) in enumerate(batch):
+            if vector is not None:
+                vectors[i] = vector
+        k = max(r[2] for r in batch)
+        allowed = None
+        if any(r[3] is not None for r in batch):
+            allowed = self.genre_index.mask([r[3] or {} for r in batch])
+        scores, indices = recommend(self.generator, vectors, k, allowed)
+        self.batches += 1
+        self.requests += len(batch)
+        results = []
+        for i, r in enumerate(batch):
+            # a filter, or a history covering the catalogue, can leave fewer than k candidates
+            found = scores[i, :r[2]] > -float('inf')
+            results.append((indices[i, :r[2]][found].tolist(), scores[i, :r[2]][found].tolist()))
+        return results
+
+
+async def handle(recommender, reader, writer):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        try:
+            request = json.loads(line)
+            vector = recommender.history_vector(request['items']) if 'items' in request else None
+            items, scores = await recommender.recommend(request.get('user'), vector, request.get('k'),
+                                                        request.get('genres'))
+            response = {'items': items, 'scores': scores}
+        except Exception as e:
+            response = {'error': str(e)}
+        writer.write((json.dumps(response) + '\n').encode())
+        await writer.drain()
+    writer.close()
+
+
+async def serve(recommender, host='127.0.0.1', port=8765, reuse_port=False):
+    """Starts `recommender` and its JSON-lines server. With `reuse_port`, several processes can listen on the same
+    port and the kernel spreads the connections over them."""
+    await recommender.start()
+    return await asyncio.start_server(lambda r, w: handle(recommender, r, w), host, port, reuse_port=reuse_port)
+
+
+async def main(args):
+    dataset = MovieLensDataset(args.ratings)
+    histories = dataset.share_memory()
+    model = CFWGAN.load_from_checkpoint(args.checkpoint, trainset=None, num_items=histories.item_count,
+                                        config=args.config)
+    cache = RecommendationCache(args.cache_size, args.cache_ttl) if args.cache_size > 0 else None
+    genre_index = None
+    if args.movies is not None:
+        genre_index = GenreIndex.from_movies(pd.read_csv(args.movies), dataset.movie_le.classes_)
+    recommender = BatchingRecommender(model.generator, histories, max_batch_size=args.max_batch_size,
+                                      max_latency_ms=args.max_latency_ms, cache=cache, genre_index=genre_index)
+    server = await serve(recommender, args.host, args.port)
+    print(f'serving on {args.host}:{args.port}')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', required=True)
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--movies', default=None, help='movies file, enables genre filters')
+    parser.add_argument('--config', default='movielens-100k')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-latency-ms', type=float, default=5.)
+    parser.add_argument('--cache-size', type=int, default=0, help='cached top-k results, 0 disables the cache')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='seconds')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,143 @@
+"""Pool of serving processes sharing one memory-mapped copy of the generator weights.
+
+Only the generator is exported from a training checkpoint. Every worker maps the weights file and the saved
+interaction matrix instead of loading its own copy, so the pages are shared through the page cache and the
+resident memory does not grow with the worker count. Workers run `serving.BatchingRecommender` behind the same
+port (SO_REUSEPORT, Linux), the kernel spreading client connections over them, each with its own intra-op thread
+budget so they do not oversubscribe the cores:
+
+    python serving_pool.py export --checkpoint model.ckpt --output generator.pt
+    python serving_pool.py serve --weights generator.pt --ratings movielens/ml-100k/ratings.csv --workers 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+
+import torch
+
+from dataset2 import MovieLensDataset, SharedCSRDataset
+from model_cfwgan import Generator
+from serving import BatchingRecommender, serve
+
+
+def export_generator(state_dict, path, config='movielens-100k'):
+    """Save the generator of a CFWGAN state dict (or a generator state dict) for `load_generator`."""
+    state_dict = {key[len('generator.'):] if key.startswith('generator.') else key: value.contiguous()
+                  for key, value in state_dict.items() if not key.startswith('discriminator.')}
+    num_items = state_dict['mlp_repeat.0.weight'].shape[1]
+    torch.save({'state_dict': state_dict, 'num_items': num_items, 'config': config}, path)
+
+
+def load_generator(path):
+    """Generator whose parameters are views of the memory-mapped file `path`, written by `export_generator`."""
+    exported = torch.load(path, mmap=True, weights_only=True)
+    with torch.device('meta'):
+        generator = Generator(exported['num_items'], exported['config'])
+    generator.load_state_dict(exported['state_dict'], assign=True)
+    return generator.eval().requires_grad_(False)
+
+
+def memory_mb(pid):
+    """(RSS, PSS) of a process in MB. PSS divides shared pages among the processes mapping them."""
+    rss = pss = 0
+    with open(f'/proc/{pid}/smaps_rollup', 'r') as file:
+        for line in file:
+            if line.startswith('Rss:'):
+                rss = int(line.split()[1])
+            elif line.startswith('Pss:'):
+                pss = int(line.split()[1])
+    return rss / 1024, pss / 1024
+
+
+def _worker(weights, histories, threads, host, port, options, ready):
+    torch.set_num_threads(threads)
+    asyncio.run(_serve_worker(weights, histories, host, port, options, ready))
+
+
+async def _serve_worker(weights, histories, host, port, options, ready):
+    recommender = BatchingRecommender(load_generator(weights), SharedCSRDataset.load(histories), **options)
+    server = await serve(recommender, host, port, reuse_port=True)
+    ready.set()
+    async with server:
+        await server.serve_forever()
+
+
+class ServingPool:
+    """`workers` spawned serving processes on `host:port`, each limited to `threads` intra-op threads.
+
+    `weights` is a file written by `export_generator`, `histories` a directory written by
+    `SharedCSRDataset.save_matrix`; the other keyword arguments go to every `BatchingRecommender`."""
+
+    def __init__(self, weights, histories, workers=2, threads=None, host='127.0.0.1', port=8765, **options):
+        self.weights = weights
+        self.histories = histories
+        self.workers = workers
+        self.threads = threads or max(1, os.cpu_count() // workers)
+        self.host = host
+        self.port = port
+        self.options = options
+        self.processes = []
+
+    def start(self, timeout=60):
+        context = multiprocessing.get_context('spawn')
+        for _ in range(self.workers):
+            ready = context.Event()
+            process = context.Process(target=_worker, daemon=True,
+                                      args=(self.weights, self.histories, self.threads, self.host, self.port,
+                                            self.options, ready))
+            process.start()
+            # tracked before waiting so that `stop` also terminates a worker that never gets ready
+            self.processes.append(process)
+            if not ready.wait(timeout):
+                self.stop()
+                raise RuntimeError(f'serving worker {process.pid} did not start')
+        return self
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+    def memory(self):
+        """(RSS, PSS) in MB of every worker."""
+        return [memory_mb(process.pid) for process in self.processes]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export')
+    export.add_argument('--checkpoint', required=True)
+    export.add_argument('--config', default='movielens-100k')
+    export.add_argument('--output', default='generator.pt')
+    pool = commands.add_parser('serve')
+    pool.add_argument('--weights', required=True)
+    pool.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    pool.add_argument('--workers', type=int, default=os.cpu_count())
+    pool.add_argument('--threads', type=int, default=None, help='intra-op threads per worker')
+    pool.add_argument('--host', default='127.0.0.1')
+    pool.add_argument('--port', type=int, default=8765)
+    pool.add_argument('--max-batch-size', type=int, default=64)
+    pool.add_argument('--max-latency-ms', type=float, default=5.)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_generator(torch.load(args.checkpoint, map_location='cpu')['state_dict'], args.output, args.config)
+    else:
+        with tempfile.TemporaryDirectory() as histories:
+            SharedCSRDataset.save_matrix(MovieLensDataset(args.ratings).matrix, histories)
+            with ServingPool(args.weights, histories, args.workers, args.threads, args.host, args.port,
+                             max_batch_size=args.max_batch_size, max_latency_ms=args.max_latency_ms) as running:
+                print(f'{args.workers} workers serving on {args.host}:{args.port}')
+                for process in running.processes:
+                    process.join()
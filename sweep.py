@@ -0,0 +1,133 @@
+"""Parallel hyperparameter sweep of CFWGAN or Classifier over one set of memory-mapped splits.
+
+The ratings are parsed and split once (same seed and ratios as train.py), and the split matrices are written as
+.npy files that every worker memory-maps, so all processes read the same pages. Each worker is a fresh process
+limited to `--threads` intra-op threads. Every value list is crossed with the others:
+
+    python sweep.py --model cfwgan --alpha 0.04 0.1 --s-zr 0.5 0.7 --d-steps 1 5 --workers 4 --output sweep.csv
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pytorch_lightning as pl
+import torch
+from torch.utils.data import DataLoader
+
+from chunking import chunk_size
+from classifier_model import Model
+from dataset2 import MovieLensDataset, SharedCSRDataset
+from model_cfwgan import CFWGAN
+from validation import ScheduledValidation, stratified_subsample
+
+SPLITS = ('train', 'val', 'test')
+
+
+def configurations(**grid):
+    """Every combination of the value lists of `grid`, as dicts."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def prepare(ratings, directory, seed=12323):
+    """Split `ratings` like train.py and save the split matrices under `directory`. Returns the item count."""
+    pl.seed_everything(seed)
+    dataset = MovieLensDataset(ratings)
+    train, test = dataset.split_train_test(test_size=0.4)
+    test, val = test.split_train_test(test_size=0.5)
+    for name, split in zip(SPLITS, (train, val, test)):
+        SharedCSRDataset.save_matrix(split.matrix, os.path.join(directory, name))
+    return dataset.item_count
+
+
+def init_worker(threads):
+    os.environ['OMP_NUM_THREADS'] = os.environ['MKL_NUM_THREADS'] = str(threads)
+    torch.set_num_threads(threads)
+
+
+def build(model, trainset, valset, testset, num_items, config):
+    if model == 'cfwgan':
+        return CFWGAN(trainset, num_items, alpha=config['alpha'], s_zr=config['s_zr'], s_pm=config['s_pm'],
+                      d_steps=config['d_steps'], g_steps=config['g_steps'], config=config['config'])
+    return Model(trainset, valset, testset, num_items, p=config['dropout'], config=config['config'])
+
+
+def run(job):
+    """Trains one configuration on the memory-mapped splits and returns its row of the results table."""
+    directory, model_name, config, max_steps, validate_every, eval_budget_mb, seed = job
+    pl.seed_everything(seed)
+    trainset, valset, testset = [SharedCSRDataset.load(os.path.join(directory, name)) for name in SPLITS]
+    result = dict(config)
+    start = time.perf_counter()
+    try:
+        model = build(model_name, trainset, valset, testset, trainset.item_count, config)
+        batch_size = config['batch_size']
+        eval_batch_size = chunk_size(valset.item_count, eval_budget_mb)
+        validation = ScheduledValidation(DataLoader(stratified_subsample(valset), eval_batch_size),
+                                         DataLoader(valset, eval_batch_size), every_n_steps=validate_every)
+        trainer = pl.Trainer(max_steps=max_steps, callbacks=[validation], logger=False, enable_checkpointing=False,
+                             enable_progress_bar=False, enable_model_summary=False)
+        trainer.fit(model, DataLoader(trainset, batch_size, shuffle=True))
+        result.update({'best_ndcg_at_5': validation.best, 'steps': trainer.global_step,
+                       'validation_time': validation.validation_time})
+    except Exception as e:
+        result['error'] = repr(e)
+    result['wall_time'] = time.perf_counter() - start
+    result['pid'], result['threads'] = os.getpid(), torch.get_num_threads()
+    return result
+
+
+def sweep(directory, model, configs, workers=1, threads=None, max_steps=5000, validate_every=100, seed=12323,
+          eval_budget_mb=512):
+    """Results of every configuration, best NDCG@5 first. Workers are spawned so they do not inherit the
+    parent's thread pools, and set `threads` in their own OMP_NUM_THREADS and MKL_NUM_THREADS as well as through
+    `torch.set_num_threads`; the parent's environment is left alone.
+    `eval_budget_mb` is the memory of each worker's evaluation batches (see `chunking`)."""
+    threads = threads or max(1, os.cpu_count() // workers)
+    jobs = [(directory, model, config, max_steps, validate_every, eval_budget_mb, seed) for config in configs]
+    with multiprocessing.get_context('spawn').Pool(workers, init_worker, (threads,)) as pool:
+        results = list(pool.imap_unordered(run, jobs))
+    table = pd.DataFrame(results)
+    if 'best_ndcg_at_5' in table:
+        table = table.sort_values('best_ndcg_at_5', ascending=False, ignore_index=True)
+    return table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ratings', default='movielens/ml-100k/ratings.csv')
+    parser.add_argument('--model', choices=['cfwgan', 'classifier'], default='cfwgan')
+    parser.add_argument('--config', nargs='+', default=['movielens-100k'])
+    parser.add_argument('--alpha', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--s-zr', type=float, nargs='+', default=[0.5])
+    parser.add_argument('--s-pm', type=float, nargs='+', default=[0.5])
+    parser.add_argument('--d-steps', type=int, nargs='+', default=[5])
+    parser.add_argument('--g-steps', type=int, nargs='+', default=[1])
+    parser.add_argument('--dropout', type=float, nargs='+', default=[0.8], help='classifier only')
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[32])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=None, help='intra-op threads per worker')
+    parser.add_argument('--max-steps', type=int, default=5000)
+    parser.add_argument('--validate-every', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=12323)
+    parser.add_argument('--eval-budget-mb', type=float, default=512, help='per worker')
+    parser.add_argument('--output', default='sweep.csv')
+    args = parser.parse_args()
+
+    if args.model == 'cfwgan':
+        grid = dict(alpha=args.alpha, s_zr=args.s_zr, s_pm=args.s_pm, d_steps=args.d_steps, g_steps=args.g_steps)
+    else:
+        grid = dict(dropout=args.dropout)
+    configs = configurations(config=args.config, batch_size=args.batch_size, **grid)
+    with tempfile.TemporaryDirectory() as directory:
+        prepare(args.ratings, directory, args.seed)
+        start = time.perf_counter()
+        table = sweep(directory, args.model, configs, args.workers, args.threads, args.max_steps,
+                      args.validate_every, args.seed, args.eval_budget_mb)
+    print(table.to_string())
+    print(f'{len(configs)} configurations in {time.perf_counter() - start:.1f} s')
+    table.to_csv(args.output, index=False)
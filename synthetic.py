@@ -0,0 +1,85 @@
+"""Synthetic MovieLens-like interactions for scale testing.
+
+Item popularity follows a Zipf law and user activity a log-normal law, the two long tails of real rating data.
+Output is either MovieLens-format `ratings.csv`/`movies.csv` or the binary cache of `dataset2.MovieLensDataset`:
+
+    python synthetic.py --users 100000 --items 50000 --mean-activity 60 --output movielens/synthetic
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataset2 import MovieLensDataset
+
+GENRES = ['Action', 'Adventure', 'Animation', "Children's", 'Comedy', 'Crime', 'Documentary', 'Drama', 'Fantasy',
+          'Film-Noir', 'Horror', 'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western']
+
+
+def ratings(num_users, num_items, mean_activity=50, zipf_exponent=1.0, activity_sigma=1.0, min_activity=5,
+            seed=0):
+    """Ratings dataframe (`userId`, `movieId`, `rating`, `timestamp`, ids starting at 1).
+
+    Item `i` of popularity rank `r` is drawn with probability proportional to `r ** -zipf_exponent`; the number
+    of draws of a user is log-normal with mean `mean_activity`, at least `min_activity`. Repeated draws of the
+    same pair are dropped, so heavy users end up slightly below their drawn activity."""
+    rng = np.random.RandomState(seed)
+    mu = np.log(mean_activity) - activity_sigma ** 2 / 2
+    activity = rng.lognormal(mu, activity_sigma, num_users).round().astype(np.int64)
+    activity = np.clip(activity, min_activity, num_items)
+
+    popularity = np.arange(1, num_items + 1, dtype=np.float64) ** -zipf_exponent
+    popularity /= popularity.sum()
+    items_by_rank = rng.permutation(num_items)
+    ranks = np.searchsorted(np.cumsum(popularity), rng.random_sample(activity.sum()), side='right')
+    items = items_by_rank[np.minimum(ranks, num_items - 1)]
+    users = np.repeat(np.arange(num_users), activity)
+
+    pairs = np.unique(users * num_items + items)
+    users, items = pairs // num_items, pairs % num_items
+    timestamps = 978300760 + rng.randint(0, 10 * 365 * 86400, len(pairs))
+    return pd.DataFrame({'userId': users + 1, 'movieId': items + 1,
+                         'rating': rng.choice(5, len(pairs), p=[.06, .11, .27, .34, .22]) + 1,
+                         'timestamp': timestamps})
+
+
+def movies(num_items, seed=0):
+    """Movies dataframe (`movieId`, `title`, `genres`) with one to three genres per movie."""
+    rng = np.random.RandomState(seed)
+    counts = rng.randint(1, 4, num_items)
+    genres = ['|'.join(sorted(rng.choice(GENRES, c, replace=False))) for c in counts]
+    ids = np.arange(1, num_items + 1)
+    return pd.DataFrame({'movieId': ids, 'title': [f'Movie {i}' for i in ids], 'genres': genres})
+
+
+def write_movielens(path, ratings_df, movies_df):
+    os.makedirs(path, exist_ok=True)
+    ratings_df.to_csv(os.path.join(path, 'ratings.csv'), index=False)
+    movies_df.to_csv(os.path.join(path, 'movies.csv'), index=False)
+
+
+def write_cache(path, ratings_df, item_based=False):
+    """Binary cache readable with `MovieLensDataset.load(path)`, skipping the CSV round trip."""
+    MovieLensDataset.from_dataframe(ratings_df, item_based=item_based).save(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--mean-activity', type=float, default=50)
+    parser.add_argument('--zipf-exponent', type=float, default=1.0)
+    parser.add_argument('--activity-sigma', type=float, default=1.0)
+    parser.add_argument('--format', choices=['csv', 'cache'], default='csv')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='movielens/synthetic')
+    args = parser.parse_args()
+
+    df = ratings(args.users, args.items, args.mean_activity, args.zipf_exponent, args.activity_sigma,
+                 seed=args.seed)
+    if args.format == 'csv':
+        write_movielens(args.output, df, movies(args.items, seed=args.seed))
+    else:
+        write_cache(args.output, df)
+    print(f'{df.userId.nunique()} users, {df.movieId.nunique()} items, {len(df)} ratings -> {args.output}')
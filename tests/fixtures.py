@@ -0,0 +1,10 @@
+import scipy.sparse as sp
+import torch
+
+from dataset2 import SharedCSRDataset
+
+
+def random_rows(users=10, num_items=40, density=0.2, seed=0):
+    """Seeded random binary interaction matrix of `users` rows, as a `SharedCSRDataset`."""
+    torch.manual_seed(seed)
+    return SharedCSRDataset.from_matrix(sp.csr_matrix((torch.rand(users, num_items) < density).float().numpy()))
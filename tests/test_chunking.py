@@ -0,0 +1,49 @@
+import unittest
+
+import torch
+from torch.utils.data import DataLoader
+
+from chunking import EVALUATION, SCORING, ChunkMemory, bytes_per_user, chunk_size, chunks
+from model_cfwgan import CFWGAN, Generator
+from recommender import recommend, recommend_all
+from tests.fixtures import random_rows
+from validation import evaluate
+
+
+class MyTestCase(unittest.TestCase):
+    def test_chunk_size(self):
+        self.assertEqual(bytes_per_user(1000, EVALUATION), 1000 * (6 * 4 + 2 * 8 + 1))
+        self.assertEqual(bytes_per_user(1000, SCORING, torch.float16), 1000 * (3 * 2 + 1))
+        size = chunk_size(62000, 1024)
+        self.assertLessEqual(size * bytes_per_user(62000), 1024 * 2 ** 20)
+        self.assertGreater((size + 1) * bytes_per_user(62000), 1024 * 2 ** 20)
+        self.assertLess(size, chunk_size(62000, 1024, SCORING))
+        self.assertEqual(chunk_size(10 ** 9, 1), 1)
+        self.assertEqual(chunk_size(100, 1024, maximum=64), 64)
+        self.assertEqual(list(chunks(10, 4)), [(0, 4), (4, 8), (8, 10)])
+
+    def test_recommend_all(self):
+        histories = random_rows()
+        generator = Generator(40).eval()
+        memory = ChunkMemory()
+        # a budget of 3 users per chunk
+        scores, indices = recommend_all(generator, histories, k=5, budget_mb=3 * bytes_per_user(40, SCORING) / 2 ** 20,
+                                        memory=memory)
+        expected_scores, expected_indices = recommend(generator, histories.rows(range(10)), 5)
+        self.assertTrue(torch.allclose(scores, expected_scores))
+        self.assertTrue(torch.equal(indices, expected_indices))
+        self.assertEqual(memory.summary()['chunks'], 4)
+
+    def test_evaluate_memory(self):
+        train, val = random_rows(), random_rows(density=0.1, seed=1)
+        model = CFWGAN(train, 40)
+        memory = ChunkMemory()
+        metrics = evaluate(model, DataLoader(val, 4), memory=memory)
+        for name, value in evaluate(model, DataLoader(val, 10)).items():
+            self.assertAlmostEqual(metrics[name], value, places=5)
+        self.assertEqual(len(memory.peaks), 3)
+        self.assertTrue(all(peak >= 0 for peak in memory.peaks))
+
+
+if __name__ == '__main__':
+    unittest.main()
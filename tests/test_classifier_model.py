@@ -0,0 +1,41 @@
+import unittest
+
+import torch
+
+from classifier_model import Model
+from tests.fixtures import random_rows
+
+
+class MyTestCase(unittest.TestCase):
+    def test_seen_items(self):
+        train, test = random_rows(6, 30, 0.2, 0), random_rows(6, 30, 0.1, 1)
+        seen = Model.seen_items(train, test)
+        self.assertEqual((seen.matrix.toarray() > 0).tolist(), ((train.matrix + test.matrix).toarray() > 0).tolist())
+        self.assertIsNone(Model.seen_items(train, None))
+
+    def test_exclude(self):
+        train, test = random_rows(6, 30, 0.3, 0), random_rows(6, 30, 0.2, 1)
+        seen = Model.seen_items(train, test)
+        idx = torch.tensor([4, 0, 2])
+        output = torch.randn(3, 30)
+        # the seen items get the best scores, so any leak reaches the top-k
+        output[seen[idx][0] > 0] += 100.
+        top = torch.topk(Model.exclude(output.clone(), seen, idx), 10, dim=-1).indices
+        for row, user in enumerate(idx.tolist()):
+            seen_items = set(seen.matrix[user].indices.tolist())
+            self.assertTrue(seen_items)
+            self.assertFalse(seen_items & set(top[row].tolist()))
+
+    def test_evaluate_excludes_seen(self):
+        train, val, test = random_rows(6, 30, 0.3, 0), random_rows(6, 30, 0.1, 1), random_rows(6, 30, 0.1, 2)
+        model = Model(train, val, test, 30).eval()
+        idx = torch.arange(6)
+        with torch.no_grad():
+            output = Model.exclude(model(train[idx][0]), model.val_seen, idx)
+        top = torch.topk(output, 5, dim=-1).indices
+        excluded = (train.matrix + test.matrix).toarray() > 0
+        self.assertFalse(excluded[idx.numpy()[:, None], top.numpy()].any())
+
+
+if __name__ == '__main__':
+    unittest.main()
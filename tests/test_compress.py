@@ -0,0 +1,26 @@
+import unittest
+
+import torch
+
+from compress import compress_generator
+from model_cfwgan import FactorizedLinear, Generator
+
+
+class MyTestCase(unittest.TestCase):
+    def test_compress_generator(self):
+        generator = Generator(40).eval()
+        compressed = compress_generator(generator, 8).eval()
+        self.assertIsInstance(compressed.mlp_repeat[-2], FactorizedLinear)
+        self.assertEqual(compressed.mlp_repeat[-2].down.weight.shape, (8, 1024))
+        self.assertIsInstance(generator.mlp_repeat[-2], torch.nn.Linear)
+        for dense, kept in zip(generator.mlp_repeat[:-2], compressed.mlp_repeat[:-2]):
+            self.assertTrue(all(torch.equal(p, q) for p, q in zip(dense.parameters(), kept.parameters())))
+
+    def test_already_factorized(self):
+        generator = Generator(40, config={'name': 'movielens-100k', 'rank': 8})
+        with self.assertRaises(ValueError):
+            compress_generator(generator, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import pickle
+import tempfile
+import unittest
+
+import torch
+
+from dataset2 import MovieLensDataset, SharedCSRDataset
+
+
+class MyTestCase(unittest.TestCase):
+    def test_share_memory(self):
+        dataset = MovieLensDataset('test_ratings.csv')
+        train, test = dataset.split_train_test(0.3)
+        shared = train.share_memory()
+        self.assertEqual(len(shared), len(train))
+        self.assertEqual(shared.item_count, train.item_count)
+        for i in range(-1, len(train)):
+            self.assertTrue(torch.equal(shared[i][0], train[i][0]))
+        idx = torch.tensor([0, 2, 3])
+        self.assertTrue(torch.equal(shared[idx][0], train[idx][0]))
+        for i in (len(train), -len(train) - 1):
+            with self.assertRaises(IndexError):
+                shared[i]
+        with self.assertRaises(IndexError):
+            shared.nonzero([0, len(train)])
+
+        shared = pickle.loads(pickle.dumps(shared))
+        self.assertTrue(torch.equal(shared[idx][0], train[idx][0]))
+
+        row, col = shared.nonzero([3, 0])
+        self.assertTrue((train.matrix[[3, 0]].toarray()[row, col] == 1).all())
+        self.assertEqual(len(row), train.matrix[[3, 0]].count_nonzero())
+
+    def test_item_based(self):
+        dataset = MovieLensDataset('test_ratings.csv')
+        items = MovieLensDataset('test_ratings.csv', item_based=True)
+        self.assertEqual(items.matrix.format, 'csr')
+        self.assertEqual((items.matrix != dataset.matrix.transpose()).nnz, 0)
+        self.assertEqual(len(items), dataset.item_count)
+        self.assertTrue(torch.equal(items[1][0], torch.tensor(dataset.matrix[:, 1].toarray().squeeze()).float()))
+
+        train, test = items.split_train_test(0.5)
+        self.assertEqual(train.matrix.format, 'csr')
+        self.assertEqual(test.matrix.format, 'csr')
+        self.assertTrue(train.item_based and test.item_based)
+        self.assertEqual(test.matrix.nnz, round(items.matrix.nnz * 0.5))
+        self.assertEqual(((train.matrix + test.matrix) != items.matrix).nnz, 0)
+
+    def test_save_load(self):
+        dataset = MovieLensDataset('test_ratings.csv')
+        with tempfile.TemporaryDirectory() as path:
+            dataset.share_memory().save(path + '/rows')
+            rows = SharedCSRDataset.load(path + '/rows')
+            self.assertTrue(torch.equal(rows[torch.arange(len(dataset))][0], dataset[torch.arange(len(dataset))][0]))
+            self.assertEqual(pickle.loads(pickle.dumps(rows)).path, rows.path)
+
+            dataset.save(path + '/dataset')
+            loaded = MovieLensDataset.load(path + '/dataset')
+            self.assertEqual((loaded.matrix != dataset.matrix).nnz, 0)
+            self.assertTrue(loaded.dataframe.equals(dataset.dataframe))
+            self.assertEqual(list(loaded.movie_le.classes_), list(dataset.movie_le.classes_))
+            del rows, loaded
+
+
+if __name__ == '__main__':
+    unittest.main()
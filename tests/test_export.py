@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+import torch
+
+from dataset2 import MovieLensDataset
+from export import IndexScoringGraph, ScoringGraph, export_torchscript, export_onnx, to_index_lists, check_parity
+from model_cfwgan import Generator
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        dataset = MovieLensDataset('test_ratings.csv')
+        self.generator = Generator(dataset.item_count).eval()
+        self.items = dataset.share_memory()[torch.arange(len(dataset))][0]
+        self.item_ids = dataset.movie_le.classes_.astype('int64')
+        self.graph = IndexScoringGraph(self.generator, dataset.item_count, 2, self.item_ids)
+
+    def test_index_lists(self):
+        history = to_index_lists(self.items)
+        self.assertEqual(history.shape, (len(self.items), int(self.items.sum(-1).max())))
+        for row, items in zip(history, self.items):
+            self.assertEqual(sorted(row[row >= 0].tolist()), torch.where(items > 0)[0].tolist())
+
+    def test_torchscript(self):
+        with tempfile.TemporaryDirectory() as directory, torch.no_grad():
+            path = os.path.join(directory, 'scoring.pt')
+            export_torchscript(self.graph, path)
+            scripted = torch.jit.load(path)
+            scores, indices, item_ids = scripted(to_index_lists(self.items))
+            self.assertTrue(check_parity((scores, indices), self.generator, self.items))
+            self.assertTrue((item_ids == torch.from_numpy(self.item_ids)[indices]).all())
+            multi_hot = torch.jit.script(ScoringGraph(self.generator, self.items.shape[1], 2))
+            self.assertTrue(check_parity(multi_hot(self.items), self.generator, self.items))
+
+    @unittest.skipIf(onnxruntime is None, 'onnxruntime is not installed')
+    def test_onnx(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'scoring.onnx')
+            export_onnx(self.graph, path, to_index_lists(self.items[:2]))
+            session = onnxruntime.InferenceSession(path)
+            outputs = session.run(None, {'history': to_index_lists(self.items).numpy()})
+            self.assertTrue(check_parity(outputs, self.generator, self.items))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+import pandas as pd
+import torch
+
+from genre_index import GenreIndex
+from recommender import recommend
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        movies = pd.read_csv('test_movies.csv')
+        # the last item id is missing from the movies file
+        self.item_ids = list(movies['movieId'][::-1]) + [99999]
+        self.movies = movies.set_index('movieId')
+        self.index = GenreIndex.from_movies(movies, self.item_ids)
+
+    def expected(self, item, all=(), any=(), exclude=()):
+        if self.item_ids[item] not in self.movies.index:
+            genres = set()
+        else:
+            genres = set(self.movies.loc[self.item_ids[item], 'genres'].split('|'))
+        return set(all) <= genres and (not any or bool(genres & set(any))) and not genres & set(exclude)
+
+    def test_mask(self):
+        self.assertEqual(len(self.index), len(self.item_ids))
+        self.assertEqual(self.index.genres_of(len(self.item_ids) - 1), [])
+        filters = [{'all': ['Comedy']}, {'any': ['Drama', 'Fantasy'], 'exclude': ['Romance']},
+                   {'all': ['Adventure', 'Children'], 'exclude': 'Animation'}, {}]
+        masks = self.index.mask(filters)
+        self.assertEqual(masks.shape, (len(filters), len(self.item_ids)))
+        for f, mask in zip(filters, masks):
+            f = {key: [value] if isinstance(value, str) else value for key, value in f.items()}
+            self.assertEqual(mask.tolist(), [self.expected(i, **f) for i in range(len(self.item_ids))])
+        self.assertTrue(torch.equal(self.index.mask(filters[0]), masks[0]))
+        with self.assertRaises(KeyError):
+            self.index.mask({'all': ['Cooking']})
+
+    def test_recommend(self):
+        generator = torch.nn.Sequential(torch.nn.Linear(len(self.item_ids), len(self.item_ids)), torch.nn.Sigmoid())
+        vectors = torch.zeros(2, len(self.item_ids))
+        vectors[0, :2] = 1
+        allowed = self.index.mask([{'all': ['Comedy']}, {'any': ['Drama']}])
+        scores, indices = recommend(generator, vectors, k=2, allowed=allowed)
+        for row in range(2):
+            for score, item in zip(scores[row], indices[row]):
+                if score > -float('inf'):
+                    self.assertTrue(allowed[row, item] and vectors[row, item] == 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
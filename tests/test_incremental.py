@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import torch
+
+from classifier_model import Model
+from dataset2 import MovieLensDataset
+from incremental import mapping, warm_start, changed_users, fine_tune_rows, split_new_interactions
+from model_cfwgan import CFWGAN
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        ratings = pd.read_csv('test_ratings.csv')
+        self.old = MovieLensDataset.from_dataframe(ratings)
+        # a new user, a new item rated by an existing user, and an item id sorting first
+        new = pd.DataFrame({'userId': [1000, 1000, 1, 2], 'movieId': [1, 5000, 5000, 0],
+                            'rating': 3, 'timestamp': 2})
+        self.new = MovieLensDataset.from_dataframe(pd.concat([ratings, new]))
+
+    def test_mapping(self):
+        items = mapping(self.old.movie_le, self.new.movie_le)
+        self.assertEqual(len(items), self.new.item_count)
+        self.assertEqual((items < 0).sum(), 2)
+        known = items >= 0
+        self.assertTrue((self.old.movie_le.classes_[items[known]] == self.new.movie_le.classes_[known]).all())
+
+        changed = changed_users(self.old, self.new, items=items)
+        expected = self.new.user_le.transform([1, 2, 1000])
+        self.assertEqual(changed.tolist(), sorted(expected))
+        rows = fine_tune_rows(len(self.new), changed, replay=0.5)
+        self.assertTrue(set(changed) <= set(rows))
+        self.assertEqual(len(rows), len(changed) + round((len(self.new) - len(changed)) * 0.5))
+
+    def test_warm_start(self):
+        items = mapping(self.old.movie_le, self.new.movie_le)
+        known = np.flatnonzero(items >= 0)
+        old_rows, new_rows = self.old.share_memory(), self.new.share_memory()
+        user = self.new.user_le.transform([3])[0]
+        history = new_rows[user][0]
+        for old_model, new_model, network in (
+                (CFWGAN(old_rows, self.old.item_count), CFWGAN(new_rows, self.new.item_count), 'generator'),
+                (Model(old_rows, None, None, self.old.item_count), Model(new_rows, None, None, self.new.item_count),
+                 'classifier')):
+            warm_start(new_model, old_model.state_dict(), items, self.old.item_count)
+            old_network, new_network = getattr(old_model, network).eval(), getattr(new_model, network).eval()
+            with torch.no_grad():
+                old_output = old_network(old_rows[self.old.user_le.transform([3])[0]][0])
+                new_output = new_network(history)
+            self.assertTrue(torch.allclose(new_output[known], old_output[items[known]], atol=1e-6))
+
+    def test_warm_start_same_size(self):
+        # a catalogue as wide as the hidden layers: only the item dimension of the input and output layers moves
+        items = np.concatenate([np.arange(255, 0, -1), [-1]])
+        old_model, new_model = CFWGAN(None, 256), CFWGAN(None, 256)
+        warm_start(new_model, old_model.state_dict(), items, 256)
+        old_state, new_state = old_model.state_dict(), new_model.state_dict()
+        for key in ('generator.mlp_repeat.0.bias', 'generator.mlp_repeat.2.weight', 'discriminator.mlp_tower.1.weight'):
+            self.assertTrue(torch.equal(new_state[key], old_state[key]))
+        history, old_history = torch.zeros(256), torch.zeros(256)
+        history[[3, 10, 100]] = 1
+        old_history[items[[3, 10, 100]]] = 1
+        with torch.no_grad():
+            old_output = old_model.generator.eval()(old_history)
+            new_output = new_model.generator.eval()(history)
+        known = items >= 0
+        self.assertTrue(torch.allclose(new_output[known], old_output[items[known]], atol=1e-6))
+
+    def test_split_new_interactions(self):
+        np.random.seed(0)
+        items = mapping(self.old.movie_le, self.new.movie_le)
+        train, val, test = split_new_interactions(self.old, self.new, (0.25, 0.25), items=items)
+        self.assertEqual(train.nnz + val.nnz + test.nnz, self.new.matrix.nnz)
+        self.assertTrue(((train + val + test) != self.new.matrix).nnz == 0)
+        # the 4 new interactions are the only candidates for val and test
+        self.assertEqual((val.nnz, test.nnz), (1, 1))
+        held_out = val + test
+        new_users = self.new.user_le.transform([1000, 1000, 1, 2])
+        new_items = self.new.movie_le.transform([1, 5000, 5000, 0])
+        arrived = set(zip(new_users.tolist(), new_items.tolist()))
+        self.assertTrue(set(zip(*map(np.ndarray.tolist, held_out.nonzero()))) <= arrived)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,13 @@
 import unittest
 
 import numpy as np
+import scipy.sparse as sp
 import torch
 from torch.utils.data import random_split
 
 from dataset import MovieLensDataset
-from model_cfwgan import MLPTower, MLPRepeat, Generator, Discriminator, CFWGAN
+from dataset2 import SharedCSRDataset
+from model_cfwgan import MLPTower, MLPRepeat, Generator, Discriminator, CFWGAN, FactorizedLinear
 import pytorch_lightning as pl
 
 
@@ -36,6 +38,79 @@ class MyTestCase(unittest.TestCase):
         out = model(x, x)
         self.assertEqual(out.shape, (8, 1))
 
+    def test_discriminator_condition(self):
+        model = Discriminator(50)
+        x, items = torch.rand(8, 50), (torch.rand(8, 50) > 0.7).float()
+        condition = model.encode_condition(items, sparse=True)
+        self.assertTrue(torch.allclose(model(x, items, condition), model(x, items), atol=1e-6))
+
+        # checkpoints with a single first layer over the concatenated inputs
+        concatenated = torch.nn.Linear(100, 1024)
+        state_dict = {f'mlp_tower.{i + 1}.{k}': v for i in (1, 3, 5)
+                      for k, v in model.mlp_tower[i].state_dict().items()}
+        state_dict.update({f'mlp_tower.0.{k}': v for k, v in concatenated.state_dict().items()})
+        model.load_state_dict(state_dict)
+        expected = model.mlp_tower(concatenated(torch.cat([x, items], dim=-1)))
+        self.assertTrue(torch.allclose(model(x, items), expected, atol=1e-5))
+
+    def test_factorized(self):
+        linear = torch.nn.Linear(20, 30)
+        x = torch.rand(4, 20)
+        self.assertTrue(torch.allclose(FactorizedLinear.from_linear(linear, 20)(x), linear(x), atol=1e-5))
+        self.assertEqual(FactorizedLinear.from_linear(linear, 5)(x).shape, (4, 30))
+        for rank in (0, 21):
+            with self.assertRaises(ValueError):
+                FactorizedLinear.from_linear(linear, rank)
+
+        config = {'name': 'movielens-100k', 'rank': 8}
+        generator = Generator(50, config)
+        self.assertIsInstance(generator.mlp_repeat[6], FactorizedLinear)
+        self.assertEqual(generator(x.new_ones(8, 50)).shape, (8, 50))
+        discriminator = Discriminator(50, config)
+        self.assertIsInstance(discriminator.candidate, FactorizedLinear)
+        self.assertIsInstance(discriminator.condition, FactorizedLinear)
+        self.assertEqual(discriminator(x.new_ones(8, 50), x.new_ones(8, 50)).shape, (8, 1))
+
+    def test_score_candidates(self):
+        items = (torch.rand(150, 2000) < 0.02).float()
+        for config in ('movielens-100k', {'name': 'movielens-100k', 'rank': 8}):
+            generator = Generator(2000, config)
+            full = generator(items)
+            # few distinct candidates: one matmul over them
+            shared = torch.tensor([[3, 7, 1], [7, 3, 1], [1, 3, -1], [1999, 0, 3]]).repeat(40, 1)[:150]
+            # one distinct candidate per row: gathered per row
+            disjoint = torch.randperm(2000)[:150].view(150, 1)
+            # lists covering most of the catalogue: the full output layer
+            wide = torch.stack([torch.randperm(2000)[:100] for _ in range(150)])
+            for candidates in (shared, disjoint, wide):
+                scores = generator.score_candidates(items, candidates)
+                expected = full.gather(1, candidates.clamp(min=0)).masked_fill(candidates < 0, 0.)
+                self.assertTrue(torch.allclose(scores, expected, atol=1e-6))
+
+    def test_sampled_output(self):
+        torch.manual_seed(0)
+        items = torch.zeros(6, 80)
+        items[torch.arange(6).repeat_interleave(3), torch.randint(0, 80, (18,))] = 1
+        for config in ('movielens-100k', {'name': 'movielens-100k', 'rank': 8}):
+            model = CFWGAN(None, 80, s_zr=5, s_pm=5, config=config)
+            zr, _ = model.negative_sampling(items)
+            self.assertIsNone(model.sampled_columns(items, zr, max_fraction=0.01))
+            columns = model.sampled_columns(items, zr, max_fraction=1.)
+            self.assertTrue(((items + zr)[:, columns].sum() == (items + zr).sum()))
+            self.assertLess(len(columns), 80)
+
+            dense, dense_output = model.generator_loss(items, zr)
+            sampled, sampled_output = model.generator_loss(items, zr, columns)
+            self.assertTrue(torch.allclose(sampled, dense, atol=1e-5))
+            self.assertTrue(torch.allclose(sampled_output, dense_output[:, columns], atol=1e-6))
+            critic = model.discriminator(dense_output * items, items)
+            self.assertTrue(torch.allclose(model.discriminator((dense_output * items)[:, columns], items[:, columns],
+                                                               columns=columns), critic, atol=1e-5))
+            d_loss, gradients_norm = model.discriminator_loss(items, columns)
+            self.assertEqual(gradients_norm.shape, (6,))
+            d_loss.backward()
+            self.assertTrue(all(p.grad is not None for p in model.discriminator.condition.parameters()))
+
     def test_precision_at_n(self):
         items = torch.tensor([[0, 1, 0, 1, 0, 1],
                               [0, 0, 0, 1, 1, 1],
@@ -72,6 +147,7 @@ class MyTestCase(unittest.TestCase):
             def __init__(self, s_zr=0.6, s_pm=0.6):
                 self.s_zr = s_zr
                 self.s_pm = s_pm
+                self.negative_sampler = None
                 self.negative_sampling = CFWGAN.negative_sampling
 
         test = Test(s_zr=0.6, s_pm=0.6)
@@ -141,6 +217,21 @@ class MyTestCase(unittest.TestCase):
         recall = CFWGAN.recall_at_n(items_predicted, items, n=4).item()
         self.assertAlmostEqual(recall, real_recall)
 
+    def test_evaluate_mask(self):
+        class FixedScores(torch.nn.Module):
+            def forward(self, items):
+                return torch.tensor([[5., 4., 3., 2., 1., 0.]]).expand(len(items), -1).clone()
+
+        train = SharedCSRDataset.from_matrix(sp.csr_matrix(np.array([[1., 0, 0, 0, 0, 0], [0, 1, 0, 0, 0, 0]])))
+        model = CFWGAN(train, 6)
+        model.generator = FixedScores()
+        # only the held-out items are ranked: the better scored items 0 and 1 never reach the top-2, so user 0
+        # finds both its held-out items 2 and 4, and user 1 its single held-out item 2
+        held_out = torch.tensor([[0., 0, 1, 0, 1, 0], [0, 0, 1, 0, 0, 0]])
+        metrics = model.evaluate((held_out, torch.tensor([0, 1])), ns=(2,))
+        self.assertAlmostEqual(float(metrics['precision_at_2']), (1 + 1 / 2) / 2)
+        self.assertAlmostEqual(float(metrics['recall_at_2']), 1.)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+import scipy.sparse as sp
+import torch
+
+from dataset2 import SharedCSRDataset
+from negative_sampler import AliasTable, NegativeSampler
+
+
+class MyTestCase(unittest.TestCase):
+    def test_alias_table(self):
+        torch.manual_seed(0)
+        weights = torch.tensor([1., 2., 3., 4., 0.])
+        draws = AliasTable(weights).sample(100000)
+        frequencies = torch.bincount(draws, minlength=5).float() / len(draws)
+        self.assertTrue(torch.allclose(frequencies, weights / weights.sum(), atol=0.01))
+
+    def test_sampler(self):
+        torch.manual_seed(0)
+        items = torch.tensor([[1, 0, 1, 0, 1, 0, 1, 0, 1, 0],
+                              [0, 0, 0, 0, 0, 1, 1, 1, 1, 1],
+                              [1, 1, 1, 1, 1, 1, 1, 1, 1, 0]]).float()
+        trainset = SharedCSRDataset.from_matrix(sp.csr_matrix(items.numpy()))
+        for power in (0., 1.):
+            sampler = NegativeSampler(trainset, power=power)
+            for n, expected in ((2, [2, 2, 1]), (0.6, [3, 3, 1]), (1.0, [5, 5, 1]), (0, [0, 0, 0])):
+                mask = sampler(items, n)
+                self.assertEqual(mask.sum(-1).tolist(), expected)
+                self.assertFalse((mask * items).any())
+
+    def test_popularity(self):
+        torch.manual_seed(0)
+        matrix = sp.csr_matrix(([1.] * 6, ([0, 1, 2, 3, 4, 0], [0, 0, 0, 0, 0, 1])), shape=(5, 4))
+        sampler = NegativeSampler(SharedCSRDataset.from_matrix(matrix), power=1.)
+        counts = sampler(torch.zeros(5000, 4), 1).sum(0)
+        self.assertGreater(counts[0], counts[1])
+        self.assertGreater(counts[1], counts[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
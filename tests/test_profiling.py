@@ -0,0 +1,68 @@
+import time
+import types
+import unittest
+
+import pytorch_lightning as pl
+import torch
+from torch.utils.data import DataLoader
+
+from model_cfwgan import CFWGAN
+from profiling import ThroughputMonitor
+from tests.fixtures import random_rows
+from validation import ScheduledValidation
+
+
+class LoggingModule:
+    def __init__(self):
+        self.device = torch.device('cpu')
+        self.phase_timer = None
+        self.logged = {}
+
+    def log(self, name, value, **kwargs):
+        self.logged[name] = value
+
+
+class MyTestCase(unittest.TestCase):
+    def test_metrics(self):
+        rows = random_rows(8)
+        model = CFWGAN(rows, 40, s_zr=5, s_pm=5)
+        trainer = pl.Trainer(max_steps=2, callbacks=[ThroughputMonitor()], logger=False, enable_checkpointing=False,
+                             enable_progress_bar=False, enable_model_summary=False)
+        trainer.fit(model, DataLoader(rows, 4))
+        metrics = trainer.callback_metrics
+        # the second step is a discriminator step: each of its phases is timed once, within the step
+        phases = ['time/negative_sampling', 'time/d_generate', 'time/gradient_penalty', 'time/d_forward',
+                  'time/d_backward', 'time/optimizer_step']
+        for name in phases + ['time/data', 'time/step', 'samples_per_sec', 'peak_rss_mb']:
+            self.assertIn(name, metrics)
+        self.assertLessEqual(sum(float(metrics[name]) for name in phases), float(metrics['time/step']))
+        expected = 4 / (float(metrics['time/data']) + float(metrics['time/step']))
+        self.assertAlmostEqual(float(metrics['samples_per_sec']) / expected, 1., places=4)
+
+    def test_validation_excluded(self):
+        for validation_first in (False, True):
+            monitor = ThroughputMonitor()
+            validation = ScheduledValidation(None, None)
+            trainer = types.SimpleNamespace(callbacks=[validation, monitor] if validation_first else
+                                            [monitor, validation], global_step=0)
+            module = LoggingModule()
+            monitor.on_fit_start(trainer, module)
+            monitor.on_train_epoch_start(trainer, module)
+            batch = (torch.zeros(4, 2),)
+            for step in range(2):
+                monitor.on_train_batch_start(trainer, module, batch, step)
+                if validation_first:
+                    # validation of this step runs before the monitor sees its end
+                    time.sleep(0.2)
+                    validation.validation_time += 0.2
+                monitor.on_train_batch_end(trainer, module, None, batch, step)
+                if not validation_first:
+                    # validation of this step runs after the monitor, before the next step starts
+                    time.sleep(0.2)
+                    validation.validation_time += 0.2
+                self.assertLess(module.logged['time/step'], 0.1)
+                self.assertLess(module.logged['time/data'], 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
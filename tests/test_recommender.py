@@ -1,7 +1,8 @@
 import torch
 import unittest
 
-from recommender import Recommender
+from model_cfwgan import Generator
+from recommender import Recommender, rerank
 
 
 class MyTestCase(unittest.TestCase):
@@ -27,5 +28,15 @@ class MyTestCase(unittest.TestCase):
             "probs: [0.9, 0.8]"
         self.assertTrue(recommender.top_k(input_vector, top_k) == expected_result)
 
+    def test_rerank(self):
+        generator = Generator(10)
+        vectors = (torch.rand(3, 10) < 0.3).float()
+        candidates = [[4, 2, 9], [1], []]
+        scores = rerank(generator, vectors, candidates)
+        self.assertEqual([len(s) for s in scores], [3, 1, 0])
+        full = generator(vectors)
+        for row, items in enumerate(candidates):
+            self.assertTrue(torch.allclose(scores[row], full[row, items], atol=1e-6))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,84 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from result_cache import RecommendationCache
+
+
+class MyTestCase(unittest.TestCase):
+    def test_fingerprint(self):
+        vector = RecommendationCache.vector_fingerprint(torch.tensor([0., 1., 0., 1.]))
+        self.assertEqual(vector, RecommendationCache.fingerprint([3, 1]))
+        self.assertEqual(vector, RecommendationCache.fingerprint([1, 3, 3, 1]))
+        self.assertNotEqual(vector, RecommendationCache.fingerprint([1, 2]))
+        # an integer multi-hot vector is a vector, not the index list [0, 1, 0, 1]
+        self.assertEqual(RecommendationCache.vector_fingerprint(torch.tensor([0, 1, 0, 1])), vector)
+        self.assertEqual(RecommendationCache.vector_fingerprint(torch.tensor([True, True])),
+                         RecommendationCache.fingerprint([0, 1]))
+        with self.assertRaises(TypeError):
+            RecommendationCache.fingerprint(torch.tensor([0., 1.]))
+
+    def test_lru_and_invalidation(self):
+        cache = RecommendationCache(max_size=2)
+        calls = []
+
+        def compute(k=3):
+            calls.append(1)
+            return list(range(k)), [1.] * k
+
+        history = torch.tensor([1., 0., 0., 1.])
+        self.assertEqual(cache.get_or_compute('a', history, 3, compute), ([0, 1, 2], [1.] * 3))
+        self.assertEqual(cache.get_or_compute('a', history, 2, compute), ([0, 1], [1.] * 2))
+        self.assertEqual(len(calls), 1)
+
+        # a new interaction changes the fingerprint
+        cache.get_or_compute('a', torch.tensor([1., 1., 0., 1.]), 3, compute)
+        self.assertEqual(len(calls), 2)
+
+        cache.get_or_compute('b', history, 3, compute)
+        cache.get_or_compute('c', history, 3, compute)
+        self.assertEqual(cache.stats(), {'size': 2, 'hits': 1, 'misses': 4, 'evictions': 1, 'invalidations': 1})
+        self.assertIsNone(cache.get('a', RecommendationCache.vector_fingerprint(history), 3))
+
+    def test_results_are_copies(self):
+        cache = RecommendationCache()
+        history = torch.tensor([1., 0., 0., 1.])
+        computed = cache.get_or_compute('a', history, 3, lambda: (torch.tensor([0.75, 0.5, 0.25]),
+                                                                  torch.tensor([2, 0, 1])))
+        computed[0].zero_()
+        hit = cache.get_or_compute('a', history, 3, None)
+        hit[0].zero_()
+        hit[1].fill_(-1)
+        scores, indices = cache.get_or_compute('a', history, 2, None)
+        self.assertEqual(scores.tolist(), [0.75, 0.5])
+        self.assertEqual(indices.tolist(), [2, 0])
+        cache.put('b', b'f', 2, ([3, 1], [0.9, 0.5]))
+        cache.get('b', b'f', 2)[0].sort()
+        self.assertEqual(cache.get('b', b'f', 2)[0], [3, 1])
+
+    def test_ttl(self):
+        cache = RecommendationCache(ttl=0.01)
+        cache.put('a', b'f', 1, ([0], [1.]))
+        self.assertIsNotNone(cache.get('a', b'f', 1))
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a', b'f', 1))
+
+    def test_concurrent(self):
+        cache = RecommendationCache(max_size=50)
+
+        def work(i):
+            user = i % 100
+            return cache.get_or_compute(user, torch.arange(100) == user, 5, lambda: (list(range(5)), [float(user)] * 5))
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(work, range(2000)))
+        self.assertTrue(all(r[1][0] == i % 100 for i, r in enumerate(results)))
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 2000)
+        self.assertEqual(stats['size'], 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader
+
+from dataset2 import MovieLensDataset
+from model_experimental import Model
+from sequence_dataset import SequenceDataset, LengthBucketSampler, collate
+
+
+class MyTestCase(unittest.TestCase):
+    def test_histories(self):
+        df = pd.DataFrame({'userId': [1, 0, 1, 0, 1, 2], 'movieId': [4, 2, 0, 1, 3, 1],
+                           'timestamp': [30, 5, 10, 1, 20, 7]})
+        dataset = SequenceDataset(df, min_length=2)
+        self.assertEqual(len(dataset), 2)
+        self.assertEqual(dataset.offsets.tolist(), [0, 2, 5, 6])
+        user, history = dataset[1]
+        self.assertEqual(user, 1)
+        self.assertEqual(history.tolist(), [0, 3, 4])
+        self.assertEqual(dataset.lengths().tolist(), [2, 3])
+
+    def test_packed_batches(self):
+        ratings = MovieLensDataset('test_ratings.csv')
+        dataset = SequenceDataset.from_dataset(ratings)
+        self.assertEqual(len(dataset.items), ratings.matrix.nnz)
+        sampler = LengthBucketSampler(dataset.lengths(), batch_size=2, bucket_multiplier=2)
+        batches = list(sampler)
+        self.assertEqual(len(batches), len(sampler))
+        self.assertEqual(sorted(i for b in batches for i in b), list(range(len(dataset))))
+
+        model = Model((len(ratings), 8), (dataset.item_count, 8), noise_size=4)
+        for users, histories in DataLoader(dataset, batch_sampler=sampler, collate_fn=collate):
+            self.assertEqual(histories.data.shape[0], sum(len(dataset[i][1]) for i in range(len(dataset))
+                                                          if dataset.users[i] in users.tolist()))
+            output = model.generator(users, histories, torch.randn(len(users), 4))
+            self.assertEqual(output.shape, (len(users), 8))
+            self.assertEqual(model.discriminator(users, output, histories).shape, (len(users), 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import unittest
+
+import torch
+
+from dataset2 import SharedCSRDataset
+from genre_index import GenreIndex
+from model_cfwgan import Generator
+from recommender import recommend
+from result_cache import RecommendationCache
+from serving import BatchingRecommender, serve
+from tests.fixtures import random_rows
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.histories = random_rows(6)
+        self.generator = Generator(40).eval()
+
+    def serve(self, scenario, **options):
+        async def run():
+            recommender = BatchingRecommender(self.generator, self.histories, k=5, **options)
+            await recommender.start()
+            try:
+                return await scenario(recommender)
+            finally:
+                if not recommender._task.done():
+                    await recommender.stop()
+        return asyncio.run(run())
+
+    def expected(self, user, k=5):
+        scores, indices = recommend(self.generator, self.histories[[user]][0].view(1, -1), k)
+        return indices[0].tolist()
+
+    def test_batching(self):
+        async def scenario(recommender):
+            results = await asyncio.gather(*[recommender.recommend(user) for user in range(4)],
+                                           recommender.recommend(vector=self.histories[1][0]))
+            return results, recommender.batches
+
+        (*results, by_vector), batches = self.serve(scenario, max_batch_size=8, max_latency_ms=50)
+        self.assertEqual(batches, 1)
+        for user, (items, scores) in enumerate(results):
+            self.assertEqual(items, self.expected(user))
+            self.assertEqual(len(scores), 5)
+        self.assertEqual(by_vector[0], self.expected(1))
+
+    def test_bad_request_fails_alone(self):
+        async def scenario(recommender):
+            return await asyncio.gather(recommender.recommend(0),
+                                        recommender.recommend(1, k=1000),
+                                        recommender.recommend(vector=torch.zeros(39)),
+                                        recommender.recommend(2, k=0),
+                                        recommender.recommend('3'),
+                                        recommender.recommend(3, k=3),
+                                        return_exceptions=True)
+
+        good, too_many, wrong_length, zero, not_an_id, other = self.serve(scenario, max_latency_ms=50)
+        self.assertEqual(good[0], self.expected(0))
+        self.assertEqual(other[0], self.expected(3, k=3))
+        for error in (too_many, wrong_length, zero, not_an_id):
+            self.assertIsInstance(error, ValueError)
+
+    def test_unknown_user(self):
+        async def scenario(recommender):
+            return await asyncio.gather(recommender.recommend(1000), recommender.recommend(-1),
+                                        recommender.recommend(5), return_exceptions=True)
+
+        unknown, negative, good = self.serve(scenario, max_latency_ms=50)
+        self.assertIsInstance(unknown, IndexError)
+        self.assertIsInstance(negative, IndexError)
+        self.assertEqual(good[0], self.expected(5))
+
+    def test_history_items(self):
+        async def scenario(recommender):
+            server = await serve(recommender, port=0)
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+            responses = []
+            for request in ({'items': [1, 5], 'k': 3}, {'items': [-1]}, {'items': [40]}, {'items': [1.5]}):
+                writer.write((json.dumps(request) + '\n').encode())
+                responses.append(json.loads(await reader.readline()))
+            writer.close()
+            server.close()
+            return responses
+
+        async def run():
+            recommender = BatchingRecommender(self.generator, self.histories, k=5, max_latency_ms=1)
+            try:
+                return await scenario(recommender)
+            finally:
+                await recommender.stop()
+
+        good, negative, too_large, not_an_index = asyncio.run(run())
+        history = torch.zeros(1, 40)
+        history[0, [1, 5]] = 1
+        self.assertEqual(good['items'], recommend(self.generator, history, 3)[1][0].tolist())
+        for response in (negative, too_large, not_an_index):
+            self.assertIn('error', response)
+        self.assertIn('[-1]', negative['error'])
+
+    def test_genre_filter(self):
+        # even items are comedies, every third item a horror movie
+        bits = torch.tensor([(item % 2 == 0) | (item % 3 == 0) << 1 for item in range(40)])
+        comedy = {'all': ['Comedy'], 'exclude': ['Horror']}
+
+        async def scenario(recommender):
+            return await asyncio.gather(recommender.recommend(0, genres=comedy),
+                                        recommender.recommend(1, genres={'all': ['Cooking']}),
+                                        recommender.recommend(2, genres=['Comedy']),
+                                        recommender.recommend(3),
+                                        return_exceptions=True)
+
+        filtered, unknown, malformed, unfiltered = self.serve(
+            scenario, max_latency_ms=50, genre_index=GenreIndex(bits, ['Comedy', 'Horror']))
+        self.assertTrue(filtered[0])
+        self.assertTrue(all(item % 2 == 0 and item % 3 != 0 for item in filtered[0]))
+        self.assertIsInstance(unknown, ValueError)
+        self.assertIsInstance(malformed, ValueError)
+        self.assertEqual(unfiltered[0], self.expected(3))
+
+    def test_cache(self):
+        updated = self.histories.matrix.tolil()
+        updated[2, 0] = updated[2, 1] = 1
+
+        async def scenario(recommender):
+            first = await recommender.recommend(2)
+            await recommender.recommend(2)
+            cached = recommender.batches
+            recommender.update_histories(SharedCSRDataset.from_matrix(updated.tocsr()))
+            second = await recommender.recommend(2)
+            return first, second, cached, recommender.batches
+
+        cache = RecommendationCache()
+        first, second, cached, batches = self.serve(scenario, cache=cache, max_latency_ms=1)
+        self.assertEqual((cached, batches), (1, 2))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+        self.assertNotIn(0, second[0])
+        self.assertNotIn(1, second[0])
+
+    def test_stop_with_queued_requests(self):
+        async def scenario(recommender):
+            # a long latency keeps the requests waiting for more of the batch when the recommender stops
+            requests = [asyncio.ensure_future(recommender.recommend(user)) for user in range(3)]
+            await asyncio.sleep(0.05)
+            await recommender.stop()
+            results = await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), 1)
+            with self.assertRaises(RuntimeError):
+                await recommender.recommend(0)
+            return results
+
+        results = self.serve(scenario, max_batch_size=8, max_latency_ms=10000)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+        async def stop_while_batching(recommender):
+            # the stop comes while the batch is still being formed, just as the requests are taken off the queue
+            requests = [asyncio.ensure_future(recommender.recommend(user)) for user in range(4)]
+            with self.assertRaises(ValueError):
+                await recommender.recommend(vector=torch.zeros(3))
+            await asyncio.wait_for(recommender.stop(), 5)
+            return await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), 1)
+
+        for _ in range(5):
+            results = self.serve(stop_while_batching, max_batch_size=8, max_latency_ms=50)
+            self.assertTrue(all(isinstance(r, (tuple, RuntimeError)) for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import unittest
+
+import torch
+
+from dataset2 import MovieLensDataset, SharedCSRDataset
+from model_cfwgan import CFWGAN
+from recommender import recommend
+from serving_pool import ServingPool, export_generator, load_generator
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dataset = MovieLensDataset('test_ratings.csv')
+        self.model = CFWGAN(None, self.dataset.item_count, config={'name': 'movielens-100k', 'rank': 2})
+        self.tmp = tempfile.TemporaryDirectory()
+        self.weights = os.path.join(self.tmp.name, 'generator.pt')
+        export_generator(self.model.state_dict(), self.weights, {'name': 'movielens-100k', 'rank': 2})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_load_generator(self):
+        generator = load_generator(self.weights)
+        self.assertFalse(any(p.requires_grad for p in generator.parameters()))
+        items = self.dataset.share_memory()[torch.arange(len(self.dataset))][0]
+        with torch.no_grad():
+            self.assertTrue(torch.equal(generator(items), self.model.generator.eval()(items)))
+
+    def test_pool(self):
+        histories = os.path.join(self.tmp.name, 'histories')
+        SharedCSRDataset.save_matrix(self.dataset.matrix, histories)
+        port = free_port()
+        expected = recommend(self.model.generator.eval(), self.dataset.share_memory()[1][0].view(1, -1), 2)[1]
+
+        async def request():
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'{"user": 1, "k": 2}\n')
+            response = json.loads(await reader.readline())
+            writer.close()
+            return response
+
+        with ServingPool(self.weights, histories, workers=2, threads=1, port=port) as pool:
+            self.assertEqual(len(pool.memory()), 2)
+            for _ in range(4):
+                self.assertEqual(asyncio.run(request())['items'], expected[0].tolist())
+
+    def test_start_timeout(self):
+        histories = os.path.join(self.tmp.name, 'histories')
+        SharedCSRDataset.save_matrix(self.dataset.matrix, histories)
+        pool = ServingPool(self.weights, histories, workers=1, threads=1, port=free_port())
+        with self.assertRaises(RuntimeError):
+            pool.start(timeout=0)
+        # the worker that was not ready in time is terminated, not leaked
+        self.assertEqual(pool.processes, [])
+        self.assertEqual(multiprocessing.active_children(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
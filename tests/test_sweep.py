@@ -0,0 +1,42 @@
+import tempfile
+import os
+import unittest
+
+from dataset2 import SharedCSRDataset
+from sweep import configurations, prepare, sweep, SPLITS
+
+
+class MyTestCase(unittest.TestCase):
+    def test_configurations(self):
+        configs = configurations(alpha=[0.04, 0.1], d_steps=[1, 5], batch_size=[32])
+        self.assertEqual(len(configs), 4)
+        self.assertIn({'alpha': 0.1, 'd_steps': 1, 'batch_size': 32}, configs)
+
+    def test_prepare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            num_items = prepare('test_ratings.csv', directory)
+            splits = [SharedCSRDataset.load(os.path.join(directory, name)) for name in SPLITS]
+            self.assertTrue(all(split.item_count == num_items for split in splits))
+            self.assertEqual(len({len(split) for split in splits}), 1)
+            total = sum(split.matrix for split in splits)
+            self.assertEqual(total.max(), 1)
+            self.assertEqual(splits[1].matrix.nnz, splits[2].matrix.nnz)
+
+    def test_sweep(self):
+        environment = {name: os.environ.get(name) for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS')}
+        configs = configurations(alpha=[0.1], s_zr=[0.5], s_pm=[0.5], d_steps=[1], g_steps=[1], batch_size=[16],
+                                 config=['movielens-100k'])
+        with tempfile.TemporaryDirectory() as directory:
+            prepare('test_ratings.csv', directory)
+            table = sweep(directory, 'cfwgan', configs, workers=1, threads=1, max_steps=4, validate_every=2,
+                          eval_budget_mb=16)
+        self.assertEqual(len(table), 1)
+        self.assertNotIn('error', table)
+        self.assertEqual(table.loc[0, 'steps'], 4)
+        self.assertEqual(table.loc[0, 'threads'], 1)
+        self.assertGreaterEqual(table.loc[0, 'best_ndcg_at_5'], 0)
+        self.assertEqual({name: os.environ.get(name) for name in environment}, environment)
+
+
+if __name__ == '__main__':
+    unittest.main()
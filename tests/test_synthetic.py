@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import synthetic
+from dataset2 import MovieLensDataset
+
+
+class MyTestCase(unittest.TestCase):
+    def test_ratings(self):
+        df = synthetic.ratings(500, 200, mean_activity=20, seed=1)
+        self.assertEqual(list(df.columns), ['userId', 'movieId', 'rating', 'timestamp'])
+        self.assertFalse(df.duplicated(['userId', 'movieId']).any())
+        self.assertTrue(df.userId.between(1, 500).all() and df.movieId.between(1, 200).all())
+        self.assertTrue(df.rating.between(1, 5).all())
+        self.assertEqual(df.userId.nunique(), 500)
+
+        # long tails: the most popular item is far above the median one
+        counts = df.movieId.value_counts()
+        self.assertGreater(counts.iloc[0], 5 * counts.median())
+        self.assertTrue(df.equals(synthetic.ratings(500, 200, mean_activity=20, seed=1)))
+
+    def test_write(self):
+        df = synthetic.ratings(100, 50, mean_activity=10)
+        with tempfile.TemporaryDirectory() as path:
+            synthetic.write_movielens(path, df, synthetic.movies(50))
+            dataset = MovieLensDataset(os.path.join(path, 'ratings.csv'))
+            self.assertEqual(dataset.matrix.nnz, len(df))
+
+            synthetic.write_cache(os.path.join(path, 'cache'), df)
+            cached = MovieLensDataset.load(os.path.join(path, 'cache'))
+            self.assertEqual((cached.matrix != dataset.matrix).nnz, 0)
+            self.assertTrue(np.array_equal(cached.movie_le.classes_, dataset.movie_le.classes_))
+            del cached
+
+
+if __name__ == '__main__':
+    unittest.main()
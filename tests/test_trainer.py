@@ -0,0 +1,70 @@
+import unittest
+
+import torch
+from torch.utils.data import DataLoader
+
+from classifier_model import Model
+from model_cfwgan import CFWGAN
+from tests.fixtures import random_rows
+from trainer import Trainer
+
+
+class MyTestCase(unittest.TestCase):
+    def test_batches(self):
+        rows = random_rows()
+        batches = Trainer(10, batch_size=4).batches(rows, 'cpu')
+        seen = []
+        for _ in range(5):
+            items, idx = next(batches)
+            self.assertEqual(items.shape, (4, 40))
+            self.assertTrue(torch.equal(items, rows[idx][0]))
+            seen.extend(idx.tolist())
+        # the incomplete batch of every epoch is dropped
+        self.assertEqual(len(set(seen[:8])), 8)
+        self.assertEqual(len(set(seen[8:16])), 8)
+
+    def test_fit_cfwgan(self):
+        rows = random_rows()
+        model = CFWGAN(rows, 40, alpha=0.1, s_zr=5, s_pm=5, d_steps=2)
+        discriminator = [p.clone() for p in model.discriminator.parameters()]
+        calls = []
+        trainer = Trainer(6, batch_size=4, evaluate_every=3, val_loader=DataLoader(rows, 5),
+                          hooks=[lambda step, metrics: calls.append(step)])
+        trainer.fit(model, rows)
+        self.assertEqual(calls, [3, 6])
+        step, metrics = trainer.history[-1]
+        self.assertTrue({'g_loss', 'd_loss', 'steps_per_second', 'ndcg_at_5'} <= set(metrics))
+        self.assertEqual(trainer.best, max(m['ndcg_at_5'] for _, m in trainer.history))
+        self.assertTrue(any(not torch.equal(p, q) for p, q in zip(model.discriminator.parameters(), discriminator)))
+
+    def test_fit_again(self):
+        rows = random_rows()
+        model = CFWGAN(rows, 40, alpha=0.1, s_zr=5, s_pm=5, d_steps=2)
+        sampled = []
+        negative_sampling = model.negative_sampling
+        model.negative_sampling = lambda items: sampled.append(len(items)) or negative_sampling(items)
+        trainer = Trainer(6, batch_size=4, hooks=())
+        trainer.fit(model, rows)
+        # the D steps sample negatives too
+        self.assertEqual(len(sampled), 6)
+        optimizers = trainer.optimizers
+        trainer.max_steps = 12
+        trainer.fit(model, rows)
+        self.assertEqual(trainer.optimizers, optimizers)
+        opt_g, opt_d = optimizers
+        first = next(model.generator.parameters())
+        # 12 steps of the (G, D, D) schedule: the Adam state carried over the second fit
+        self.assertEqual(int(opt_g.state[first]['step']), 4)
+        self.assertEqual(int(opt_d.state[next(model.discriminator.parameters())]['step']), 8)
+
+    def test_fit_classifier(self):
+        rows = random_rows()
+        model = Model(rows, None, None, 40)
+        trainer = Trainer(4, batch_size=4, evaluate_every=2, hooks=())
+        trainer.fit(model, rows)
+        self.assertEqual([step for step, _ in trainer.history], [2, 4])
+        self.assertIn('loss', trainer.history[0][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
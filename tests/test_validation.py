@@ -0,0 +1,92 @@
+import types
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+
+from dataset2 import SharedCSRDataset
+from validation import ScheduledValidation, stratified_subsample
+
+
+class ScriptedModule(nn.Module):
+    """Module whose `evaluate` returns the next NDCG of `values`, one per evaluated loader (single batch)."""
+
+    def __init__(self, values):
+        super().__init__()
+        self.values = list(values)
+        self.device = torch.device('cpu')
+        self.calls = []
+
+    def evaluate(self, batch, ns=(5,)):
+        items, idx = batch
+        self.calls.append(len(idx))
+        return {'ndcg_at_5': torch.tensor(self.values.pop(0))}
+
+
+def trainer():
+    return types.SimpleNamespace(global_step=0, callback_metrics={}, logger=None, should_stop=False)
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self):
+        rows = SharedCSRDataset.from_matrix(sp.eye(10, 20, format='csr'))
+        self.subsample = DataLoader(torch.utils.data.Subset(rows, [0, 1]), 10)
+        self.full = DataLoader(rows, 10)
+
+    def run_steps(self, callback, module, state, steps):
+        for step in steps:
+            state.global_step = step
+            callback.on_train_batch_end(state, module, None, None, 0)
+
+    def test_subsample_then_full(self):
+        module = ScriptedModule([0.3, 0.25, 0.2, 0.4, 0.35])
+        callback = ScheduledValidation(self.subsample, self.full, every_n_steps=10, patience=5)
+        state = trainer()
+        callback.on_train_start(state, module)
+        self.run_steps(callback, module, state, [5, 10])
+        # improvement: subsample (2 users) then full set (10 users)
+        self.assertEqual(module.calls, [2, 10])
+        self.assertAlmostEqual(float(state.callback_metrics['sub_ndcg_at_5']), 0.3)
+        self.assertAlmostEqual(float(state.callback_metrics['ndcg_at_5']), 0.25)
+        self.run_steps(callback, module, state, [10, 20])
+        # the same step is not validated twice, no improvement: subsample only and no monitor to checkpoint on
+        self.assertEqual(module.calls, [2, 10, 2])
+        self.assertNotIn('ndcg_at_5', state.callback_metrics)
+        self.run_steps(callback, module, state, [30])
+        self.assertEqual(module.calls, [2, 10, 2, 2, 10])
+        self.assertAlmostEqual(callback.best, 0.35)
+        self.assertEqual(callback.full_evaluations, 2)
+        callback.on_train_end(state, module)
+        self.assertEqual(callback.report['full_evaluations'], 2)
+
+    def test_patience(self):
+        module = ScriptedModule([0.3, 0.3, 0.2, 0.3, 0.1])
+        callback = ScheduledValidation(self.subsample, self.full, every_n_steps=10, patience=3)
+        state = trainer()
+        self.run_steps(callback, module, state, [10, 20, 30])
+        self.assertFalse(state.should_stop)
+        self.run_steps(callback, module, state, [40])
+        self.assertTrue(state.should_stop)
+        self.assertEqual(callback.wait, 3)
+
+    def test_stratified_subsample(self):
+        # five activity levels of 20 users each, plus 3 users without interactions
+        counts = np.repeat([1, 5, 10, 20, 40], 20)
+        matrix = sp.lil_matrix((103, 50))
+        for user, count in enumerate(counts):
+            matrix[user, :count] = 1
+        dataset = SharedCSRDataset.from_matrix(matrix.tocsr())
+        subset = stratified_subsample(dataset, fraction=0.1, bins=5)
+        selected = np.array(subset.indices)
+        self.assertTrue((selected < 100).all())
+        self.assertEqual(np.bincount(counts[selected], minlength=41)[[1, 5, 10, 20, 40]].tolist(), [2] * 5)
+        # a tiny fraction still keeps one user per stratum
+        selected = np.array(stratified_subsample(dataset, fraction=0.001, bins=5).indices)
+        self.assertEqual(sorted(set(counts[selected])), [1, 5, 10, 20, 40])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,11 @@
 from pytorch_lightning.callbacks import ModelCheckpoint
 from torch.utils.data import random_split, DataLoader
 
+from chunking import ChunkMemory, chunk_size
 from model_cfwgan import CFWGAN
 from dataset2 import MovieLensDataset
+from profiling import ThroughputMonitor
+from validation import ScheduledValidation, stratified_subsample
 import torch
 import pytorch_lightning as pl
 
@@ -10,21 +13,33 @@ import pytorch_lightning as pl
 pl.seed_everything(12323)
 
 batch_size = 32
+validate_every = 100
+# memory for the dense tensors of an evaluation batch, which sets its size from the catalogue size
+eval_budget_mb = 1024
+num_workers = 0
 config = 'movielens-100k'
 
 dataset = MovieLensDataset('movielens/ml-100k/ratings.csv', item_based=False)
 print(dataset.matrix.shape)
 train, test = dataset.split_train_test(test_size=0.4)
 test, val = test.split_train_test(test_size=0.5)
+train_rows = train.share_memory()
 
-model = CFWGAN(train, dataset.item_count, alpha=0.1, s_zr=0.5, s_pm=0.5, d_steps=5, g_steps=1, config=config)
+model = CFWGAN(train_rows, dataset.item_count, alpha=0.1, s_zr=0.5, s_pm=0.5, d_steps=5, g_steps=1, config=config)
 
 model_checkpoint = ModelCheckpoint(monitor='ndcg_at_5', save_top_k=5, save_weights_only=True, mode='max',
-                                   filename='model-{step}-{ndcg_at_5:.4f}')
-
-trainer = pl.Trainer(max_epochs=1000, callbacks=[model_checkpoint], log_every_n_steps=5,
-                     )
-trainer.fit(model, DataLoader(train, batch_size, shuffle=True), DataLoader(val, batch_size*2))
-model = CFWGAN.load_from_checkpoint(model_checkpoint.best_model_path, trainset=train, num_items=dataset.item_count)
-trainer.test(model, DataLoader(test, batch_size*2))
+                                   every_n_train_steps=validate_every, filename='model-{step}-{ndcg_at_5:.4f}')
+
+val_rows = val.share_memory()
+eval_batch_size = chunk_size(dataset.item_count, eval_budget_mb)
+validation = ScheduledValidation(DataLoader(stratified_subsample(val_rows), eval_batch_size),
+                                 DataLoader(val_rows, eval_batch_size, num_workers=num_workers),
+                                 every_n_steps=validate_every, monitor='ndcg_at_5', memory=ChunkMemory())
+
+trainer = pl.Trainer(max_epochs=1000, callbacks=[ThroughputMonitor(), validation, model_checkpoint],
+                     log_every_n_steps=5)
+# workers only receive handles to the shared CSR arrays, not the dataframes and encoders
+trainer.fit(model, DataLoader(train_rows, batch_size, shuffle=True, num_workers=num_workers))
+model = CFWGAN.load_from_checkpoint(model_checkpoint.best_model_path, trainset=train_rows, num_items=dataset.item_count)
+trainer.test(model, DataLoader(test.share_memory(), eval_batch_size, num_workers=num_workers))
 
@@ -1,14 +1,18 @@
 from pytorch_lightning.callbacks import ModelCheckpoint
 from torch.utils.data import random_split, DataLoader
 
+from chunking import ChunkMemory, chunk_size
 from classifier_model import Model
 from dataset2 import MovieLensDataset
+from validation import ScheduledValidation, stratified_subsample
 import torch
 import pytorch_lightning as pl
 
 pl.seed_everything(12323)
 
 batch_size = 32
+validate_every = 100
+eval_budget_mb = 1024
 config = 'movielens-100k'
 
 dataset = MovieLensDataset('movielens/ml-100k/ratings.csv', item_based=False)
@@ -19,12 +23,17 @@ train, val = train.split_train_test(test_size=0.2)
 model = Model(train, val, test, dataset.item_count)
 
 model_checkpoint = ModelCheckpoint(monitor='ndcg_at_5', save_top_k=5, save_weights_only=True, mode='max',
-                                   filename='model-{step}-{ndcg_at_5:.4f}')
+                                   every_n_train_steps=validate_every, filename='model-{step}-{ndcg_at_5:.4f}')
 
-trainer = pl.Trainer(max_epochs=1000, callbacks=[model_checkpoint], log_every_n_steps=5,
+eval_batch_size = chunk_size(dataset.item_count, eval_budget_mb)
+validation = ScheduledValidation(DataLoader(stratified_subsample(val), eval_batch_size),
+                                 DataLoader(val, eval_batch_size), every_n_steps=validate_every, monitor='ndcg_at_5',
+                                 memory=ChunkMemory())
+
+trainer = pl.Trainer(max_epochs=1000, callbacks=[validation, model_checkpoint], log_every_n_steps=5,
                      )
-trainer.fit(model, DataLoader(train, batch_size, shuffle=True), DataLoader(val, batch_size*2))
+trainer.fit(model, DataLoader(train, batch_size, shuffle=True))
 model = Model.load_from_checkpoint(model_checkpoint.best_model_path, trainset=train, valset=val, testset=test,
                                    num_items=dataset.item_count)
-trainer.test(model, DataLoader(test, batch_size*2))
+trainer.test(model, DataLoader(test, eval_batch_size))
 
@@ -0,0 +1,142 @@
+"""Minimal training loop for `model_cfwgan.CFWGAN` and `classifier_model.Model`, without Lightning.
+
+Batches are scattered straight from the CSR rows of a `dataset2.SharedCSRDataset` into one preallocated
+(batch_size, num_items) buffer, and every step calls the loss methods of the model and its optimizers directly,
+with no logging, optimizer wrapping or hooks in between. With `compile=True` the G step (or the classifier step)
+loss and the generator are compiled with torch.compile; the D step stays eager, the double backward of the
+gradient penalty not being supported by compiled graphs. The optimizers and compiled functions are built on the
+first `fit` of a model and kept by later calls, which resume its schedule. Every `evaluate_every` steps the mean
+training losses, the throughput and the `validation.evaluate` metrics on `val_loader` are passed to each hook:
+
+    trainer = Trainer(max_steps=20000, compile=True, evaluate_every=500, val_loader=val_loader)
+    trainer.fit(model, train_split.share_memory())
+"""
+import time
+
+import numpy as np
+import torch
+
+from model_cfwgan import CFWGAN
+from validation import evaluate
+
+
+def print_metrics(step, metrics):
+    print(f'step {step}: ' + ', '.join(f'{name}: {value:.4g}' for name, value in metrics.items()))
+
+
+class Trainer:
+    """Trains for `max_steps` optimizer steps on shuffled batches of `batch_size` users, the last incomplete
+    batch of every epoch being dropped so the buffer (and a compiled step) keeps one shape.
+
+    `hooks` are callables `hook(step, metrics)` run every `evaluate_every` steps; `history` keeps their
+    (step, metrics) and `best` the best `monitor` value seen; `optimizers` are those of the model last fitted."""
+
+    def __init__(self, max_steps, batch_size=32, compile=False, evaluate_every=None, val_loader=None,
+                 monitor='ndcg_at_5', hooks=(print_metrics,), seed=0):
+        self.max_steps = max_steps
+        self.batch_size = batch_size
+        self.compile = compile
+        self.evaluate_every = evaluate_every
+        self.val_loader = val_loader
+        self.monitor = monitor
+        self.hooks = list(hooks)
+        self.seed = seed
+        self.history = []
+        self.best = -float('inf')
+        self.global_step = 0
+        self.optimizers = []
+        self._model = None
+        self._schedule = None
+
+    def batches(self, trainset, device):
+        """Endless (items, idx) batches of `trainset`, `items` being a view of a buffer reused by every batch:
+        only the entries set by the previous batch are cleared."""
+        rng = np.random.default_rng(self.seed)
+        buffer = torch.zeros(self.batch_size, trainset.shape[1], device=device)
+        previous = None
+        while True:
+            order = rng.permutation(len(trainset))
+            stop = len(order) - len(order) % self.batch_size or len(order)
+            for start in range(0, stop, self.batch_size):
+                idx = order[start:start + self.batch_size]
+                if previous is not None:
+                    buffer[previous] = 0
+                row, col = trainset.nonzero(idx)
+                previous = (torch.from_numpy(row).to(device), torch.from_numpy(col).to(device))
+                buffer[previous] = 1
+                yield buffer[:len(idx)], torch.from_numpy(idx)
+
+    @staticmethod
+    def _update(optimizer, loss):
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        return loss.detach()
+
+    def steps(self, model):
+        """One callable per step of the schedule of `model`, each taking a batch and returning {name: loss}."""
+        if isinstance(model, CFWGAN):
+            (opt_g, opt_d), _ = model.configure_optimizers()
+            self.optimizers = [opt_g, opt_d]
+            generator_loss = model.generator_loss
+            if self.compile:
+                model.generator.compile()
+                generator_loss = torch.compile(generator_loss)
+
+            def sample(items):
+                # every step samples the negatives, as the Lightning training_step does
+                zr, _ = model.negative_sampling(items)
+                return zr, model.sampled_columns(items, zr) if model.sampled_output else None
+
+            def g_step(items):
+                zr, columns = sample(items)
+                return {'g_loss': Trainer._update(opt_g, generator_loss(items, zr, columns)[0])}
+
+            def d_step(items):
+                _, columns = sample(items)
+                return {'d_loss': Trainer._update(opt_d, model.discriminator_loss(items, columns)[0])}
+
+            return [g_step] * model.g_steps + [d_step] * model.d_steps
+
+        optimizer = model.configure_optimizers()
+        self.optimizers = [optimizer]
+        loss = torch.compile(model.loss) if self.compile else model.loss
+
+        def step(items):
+            return {'loss': Trainer._update(optimizer, loss(items)[0])}
+
+        return [step]
+
+    def report(self, model, losses, count, elapsed):
+        metrics = {name: float(total) / count[name] for name, total in losses.items()}
+        metrics['steps_per_second'] = sum(count.values()) / elapsed
+        if self.val_loader is not None:
+            metrics.update(evaluate(model, self.val_loader))
+            self.best = max(self.best, metrics.get(self.monitor, self.best))
+        self.history.append((self.global_step, metrics))
+        for hook in self.hooks:
+            hook(self.global_step, metrics)
+        return metrics
+
+    def fit(self, model, trainset):
+        device = next(model.parameters()).device
+        model.train()
+        if self._model is not model:
+            self._model, self._schedule = model, self.steps(model)
+        schedule = self._schedule
+        batches = self.batches(trainset, device)
+        # losses stay on the device between reports, no synchronization per step
+        losses, count = {}, {}
+        start = time.perf_counter()
+        while self.global_step < self.max_steps:
+            items, _ = next(batches)
+            for name, loss in schedule[self.global_step % len(schedule)](items).items():
+                losses[name] = losses.get(name, 0.) + loss
+                count[name] = count.get(name, 0) + 1
+            self.global_step += 1
+            if self.evaluate_every and (self.global_step % self.evaluate_every == 0
+                                        or self.global_step == self.max_steps):
+                self.report(model, losses, count, time.perf_counter() - start)
+                losses, count = {}, {}
+                start = time.perf_counter()
+        return model
@@ -0,0 +1,111 @@
+import contextlib
+import time
+
+import numpy as np
+import pytorch_lightning as pl
+import torch
+from torch.utils.data import Subset
+
+
+def stratified_subsample(dataset, fraction=0.2, bins=5, seed=0):
+    """Fixed subset of the users of `dataset`, stratified by their number of interactions.
+
+    Users without interactions are left out since the metrics ignore them. Every activity quantile keeps
+    `fraction` of its users (at least one), so light and heavy users stay represented."""
+    counts = np.asarray(dataset.matrix.getnnz(axis=1))
+    users = np.where(counts > 0)[0]
+    edges = np.quantile(counts[users], np.linspace(0, 1, bins + 1)[1:-1])
+    strata = np.searchsorted(edges, counts[users], side='right')
+    rng = np.random.RandomState(seed)
+    selected = []
+    for s in np.unique(strata):
+        members = users[strata == s]
+        selected.append(rng.choice(members, max(1, round(len(members) * fraction)), replace=False))
+    return Subset(dataset, np.sort(np.concatenate(selected)).tolist())
+
+
+def evaluate(pl_module, loader, ns=(5,), memory=None):
+    """Average of `pl_module.evaluate` over `loader`, weighted by batch size like Lightning's epoch means.
+
+    With a `chunking.ChunkMemory` as `memory`, the peak memory of every batch is recorded in it."""
+    training = pl_module.training
+    pl_module.eval()
+    totals, count = {}, 0
+    with torch.no_grad():
+        for items, idx in loader:
+            with memory.chunk() if memory is not None else contextlib.nullcontext():
+                metrics = pl_module.evaluate((items.to(pl_module.device), idx), ns=ns)
+            for name, value in metrics.items():
+                totals[name] = totals.get(name, 0.) + float(value) * len(items)
+            count += len(items)
+    pl_module.train(training)
+    return {name: value / count for name, value in totals.items()}
+
+
+class ScheduledValidation(pl.Callback):
+    """Validation driven by a fixed user subsample instead of a full pass every epoch.
+
+    Every `every_n_steps` training steps the metrics are computed on `subsample_loader` and logged with a
+    `sub_` prefix. The full `val_loader` is evaluated only when the subsample `monitor` improves; its metrics are
+    then published under their own names, so a `ModelCheckpoint(monitor=monitor, every_n_train_steps=every_n_steps)`
+    saves exactly the fully validated models. Training stops after `patience` subsample evaluations without
+    improvement. Fit without a Lightning val dataloader: this callback replaces the validation loop. With a
+    `chunking.ChunkMemory` as `memory`, the peak memory of the full validation batches is recorded and reported.
+    """
+
+    def __init__(self, subsample_loader, val_loader, every_n_steps=100, monitor='ndcg_at_5', patience=20,
+                 min_delta=0., memory=None):
+        self.subsample_loader = subsample_loader
+        self.val_loader = val_loader
+        self.every_n_steps = every_n_steps
+        self.monitor = monitor
+        self.patience = patience
+        self.min_delta = min_delta
+        self.memory = memory
+        self.best_subsample = -float('inf')
+        self.best = -float('inf')
+        self.wait = 0
+        self.full_evaluations = 0
+        self.validation_time = 0.
+        self.train_start = None
+        self.report = {}
+        self._last_step = None
+
+    def on_train_start(self, trainer, pl_module):
+        self.train_start = time.perf_counter()
+
+    def on_train_batch_end(self, trainer, pl_module, outputs, batch, batch_idx, dataloader_idx=0):
+        step = trainer.global_step
+        if step == 0 or step % self.every_n_steps != 0 or step == self._last_step:
+            return
+        self._last_step = step
+        start = time.perf_counter()
+
+        # the checkpoint only sees the monitor when the full validation ran at this step
+        trainer.callback_metrics.pop(self.monitor, None)
+        metrics = {f'sub_{name}': value for name, value in evaluate(pl_module, self.subsample_loader).items()}
+        if metrics[f'sub_{self.monitor}'] > self.best_subsample + self.min_delta:
+            self.best_subsample = metrics[f'sub_{self.monitor}']
+            self.wait = 0
+            full = evaluate(pl_module, self.val_loader, memory=self.memory)
+            self.best = max(self.best, full[self.monitor])
+            self.full_evaluations += 1
+            metrics.update(full)
+        else:
+            self.wait += 1
+            if self.wait >= self.patience:
+                trainer.should_stop = True
+
+        trainer.callback_metrics.update({name: torch.tensor(value) for name, value in metrics.items()})
+        if trainer.logger is not None:
+            trainer.logger.log_metrics(metrics, step=step)
+        self.validation_time += time.perf_counter() - start
+
+    def on_train_end(self, trainer, pl_module):
+        total = time.perf_counter() - self.train_start
+        self.report = {'train_time': total - self.validation_time, 'validation_time': self.validation_time,
+                       'validation_share': self.validation_time / total, 'full_evaluations': self.full_evaluations,
+                       f'best_{self.monitor}': self.best}
+        if self.memory is not None:
+            self.report['eval_peak_mb'] = self.memory.summary()['peak_mb']
+        print(', '.join(f'{name}: {value:.4g}' for name, value in self.report.items()))